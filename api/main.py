@@ -1,22 +1,31 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+import anyio
+import asyncio
 import tempfile
 import os
 import sys
 import json
-import pandas as pd
 from datetime import date, datetime
-import pickle
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
 
 from utils.date_utils import standardize_date_format
 from services.gemini_recommendation_service import GeminiRecommendationService
-from utils.data_manager import save_bill_data_to_history, retrain_models_with_history
+from utils.data_manager import save_bill_data_to_history
+from utils.upload_utils import save_upload, UploadTooLargeError
+from api.routers import bills, predictions, anomalies
 
 from dotenv import load_dotenv
 import os
+import config
 
 load_dotenv()
 
@@ -26,53 +35,42 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import your services
 recommendation_service = GeminiRecommendationService(api_key=api_key)
-from scripts.direct_gemini_extraction import extract_bill_data
-from services.prediction_service import PredictionService
-from ml_models.anomaly_detector import AnomalyDetector
-
+from services.container import ServiceContainer, get_services
+from services.job_manager import JobError
+from utils.metrics import MetricsMiddleware, get_metrics, time_stage
 
 
-# Load pre-trained ML models
-def load_ml_models():
-    models = {}
-    try:
-        models_dir = 'models'
-        
-        # Bill prediction model
-        if os.path.exists(f'{models_dir}/bill_predictor_model.pkl'):
-            with open(f'{models_dir}/bill_predictor_model.pkl', 'rb') as f:
-                models['bill_model'] = pickle.load(f)
-            with open(f'{models_dir}/bill_predictor_scaler.pkl', 'rb') as f:
-                models['bill_scaler'] = pickle.load(f)
-                
-        # Appliance prediction model
-        if os.path.exists(f'{models_dir}/appliance_predictor_model.pkl'):
-            with open(f'{models_dir}/appliance_predictor_model.pkl', 'rb') as f:
-                models['appliance_model'] = pickle.load(f)
-            with open(f'{models_dir}/appliance_predictor_scaler.pkl', 'rb') as f:
-                models['appliance_scaler'] = pickle.load(f)
-                
-        # Combined prediction model
-        if os.path.exists(f'{models_dir}/combined_predictor_model.pkl'):
-            with open(f'{models_dir}/combined_predictor_model.pkl', 'rb') as f:
-                models['combined_model'] = pickle.load(f)
-            with open(f'{models_dir}/combined_predictor_scaler.pkl', 'rb') as f:
-                models['combined_scaler'] = pickle.load(f)
-        
-        print(f"Loaded {len(models)//2} ML models successfully")
-        return models
-    except Exception as e:
-        print(f"Error loading ML models: {str(e)}")
-        return {}
 
-# Load models at startup
-ml_models = load_ml_models()
+# Load the shared services and models once per worker
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Threads available to the sync (def) endpoints
+    anyio.to_thread.current_default_thread_limiter().total_tokens = config.API_THREADPOOL_SIZE
+    services_started = time.perf_counter()
+    services = ServiceContainer().load()
+    app.state.services = services
+    
+    # Models load on first use; optionally start loading them in the background now
+    if config.MODEL_WARMUP:
+        services.executor.submit(services.warm_up)
+    
+    ready = time.perf_counter()
+    app.state.startup_timings = {
+        'imports': round(_imports_finished - _import_started, 3),
+        'services': round(ready - services_started, 3),
+        'total': round(ready - _import_started, 3)
+    }
+    print("Startup timing: imports {imports:.2f}s, services {services:.2f}s, ready after {total:.2f}s".format(
+        **app.state.startup_timings))
+    yield
+    services.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="Electricity Bill Analyzer API",
     description="API for analyzing and predicting electricity bills",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -84,21 +82,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Define schemas
-class BillBase(BaseModel):
-    account_number: str
-    bill_date: str
-    kwh_used: float
-    total_bill_amount: float
+# Per-route request counts, latency histograms and in-flight requests
+app.add_middleware(MetricsMiddleware)
+
+# Bills, predictions and anomalies are served by the routers
+app.include_router(bills.router, prefix="/api/bills", tags=["bills"])
+app.include_router(predictions.router, prefix="/api/predictions", tags=["predictions"])
+app.include_router(anomalies.router, prefix="/api/anomalies", tags=["anomalies"])
 
-class PredictionRequest(BaseModel):
-    account_number: str
-    future_months: int = 3
+# Time spent importing this module (reported at startup)
+_imports_finished = time.perf_counter()
 
-class PredictionResponse(BaseModel):
-    account_number: str
-    predictions: List[Dict]
+# How often a job event stream checks for new events, and how long it can go
+# quiet before sending a keep-alive comment (seconds)
+JOB_EVENTS_POLL_INTERVAL = 0.1
+JOB_EVENTS_KEEPALIVE = 15
 
+# Most scenarios accepted by /api/appliances/batch in one request
+MAX_APPLIANCE_SCENARIOS = 10000
+
+# Typical wattage and usage factor of each appliance, used to split predicted usage
+APPLIANCE_DATA = {
+    'air_conditioner': {'avg_wattage': 1500, 'factor': 1.0},
+    'refrigerator': {'avg_wattage': 150, 'factor': 24.0},
+    'water_heater': {'avg_wattage': 4000, 'factor': 0.9},
+    'clothes_dryer': {'avg_wattage': 3000, 'factor': 1.0},
+    'washing_machine': {'avg_wattage': 500, 'factor': 1.0}
+}
+
+# Define schemas
 class ApplianceUsageRequest(BaseModel):
     air_conditioner: float = 0
     refrigerator: float = 24
@@ -108,6 +120,9 @@ class ApplianceUsageRequest(BaseModel):
     household_size: int = 3
     home_sqft: int = 1800
 
+class ApplianceBatchRequest(BaseModel):
+    scenarios: List[ApplianceUsageRequest]
+
 class CombinedPredictionRequest(BaseModel):
     bill_id: int
     air_conditioner: float = 0
@@ -118,11 +133,6 @@ class CombinedPredictionRequest(BaseModel):
     household_size: int = 3
     home_sqft: int = 1800
 
-# Initialize services
-# Note: extract_bill_data is a function, not a class, so we don't initialize it here
-prediction_service = PredictionService()
-anomaly_detector = AnomalyDetector()
-
 # Root endpoint
 @app.get("/")
 async def root():
@@ -132,225 +142,203 @@ async def root():
         "endpoints": [
             "/api/bills",
             "/api/predictions",
+            "/api/predictions/batch",
             "/api/anomalies",
             "/api/upload",
             "/api/appliances",
+            "/api/appliances/batch",
             "/api/combined-prediction"
         ]
     }
 
-# Get all bills
-@app.get("/api/bills")
-async def get_all_bills():
+@app.post("/api/upload", status_code=202)
+async def upload_bill(file: UploadFile = File(...), future_months: int = 3,
+                      services: ServiceContainer = Depends(get_services)):
     try:
-        with open('data/processed/combined_bills.json', 'r') as f:
-            bills = json.load(f)
-        return bills
-    except Exception as e:
-        return {"error": str(e)}
-
-# Get specific bill
-@app.get("/api/bills/{bill_id}")
-async def get_bill(bill_id: int):
-    try:
-        with open('data/processed/combined_bills.json', 'r') as f:
-            bills = json.load(f)
+        # Stream the uploaded file to disk (stored by content hash)
+        file_path, file_sha256 = await save_upload(file)
         
-        if bill_id < 1 or bill_id > len(bills):
-            raise HTTPException(status_code=404, detail="Bill not found")
+        # Extraction, storage, retraining and analysis run in the background;
+        # the client follows GET /api/jobs/{job_id}/events (or polls
+        # GET /api/jobs/{job_id}) for partial and final results
+        job = services.job_manager.submit('upload', process_uploaded_bill, file_path, file_sha256,
+                                          future_months, services)
         
-        return bills[bill_id - 1]
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        return {"error": str(e)}
-
-# Get predictions
-@app.post("/api/predictions", response_model=PredictionResponse)
-async def predict_bills(request: PredictionRequest):
-    try:
-        # Load historical data for this account
-        with open('data/processed/combined_bills.json', 'r') as f:
-            all_bills = json.load(f)
-        
-        # Filter for the requested account
-        account_bills = [b for b in all_bills if b.get('account_number') == request.account_number]
-        
-        if not account_bills:
-            raise HTTPException(status_code=404, detail=f"No data found for account {request.account_number}")
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(account_bills)
-        
-        # Convert date columns
-        date_columns = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col])
-        
-        # Generate usage predictions
-        usage_predictions = prediction_service.usage_predictor.predict(df, future_months=request.future_months)
-        
-        if usage_predictions is None:
-            raise HTTPException(status_code=500, detail="Failed to generate usage predictions")
-        
-        # Generate cost predictions
-        predictions = []
-        for _, row in usage_predictions.iterrows():
-            kwh_prediction = row['predicted_kwh']
-            cost_prediction = prediction_service.cost_predictor.predict_cost(kwh_prediction)
-            
-            if cost_prediction:
-                predictions.append({
-                    "prediction_date": row['prediction_date'],
-                    "predicted_kwh": kwh_prediction,
-                    "lower_bound": row['lower_bound'],
-                    "upper_bound": row['upper_bound'],
-                    "avg_daily_temperature": row['avg_daily_temperature'],
-                    "total_bill_amount": cost_prediction['total_bill_amount'],
-                    "utility_charges": cost_prediction['utility_charges'],
-                    "supplier_charges": cost_prediction['supplier_charges']
-                })
-        
-        return {
-            "account_number": request.account_number,
-            "predictions": predictions
-        }
+        return {"job_id": job.id, "status": job.status}
         
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
+        print(f"Error in upload endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Get anomalies
-@app.get("/api/anomalies/{bill_id}")
-async def get_anomalies(bill_id: int):
-    try:
-        with open('data/processed/combined_bills.json', 'r') as f:
-            bills = json.load(f)
-        
-        if bill_id < 1 or bill_id > len(bills):
-            raise HTTPException(status_code=404, detail="Bill not found")
-        
-        bill = bills[bill_id - 1]
-        
-        # Detect anomalies
-        anomalies = anomaly_detector.detect_anomalies(bill)
-        
-        return anomalies
-        
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail=str(e))
+# Request and stage metrics in the Prometheus text format
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(get_metrics().render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
-@app.post("/api/upload")
-async def upload_bill(file: UploadFile = File(...), future_months: int = 3):
-    try:
-        # Save uploaded file
-        file_path = f"data/raw/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Extract data from the bill using Gemini
-        bill_data = extract_bill_data(file_path, api_key)
-        
-        if not bill_data:
-            raise HTTPException(status_code=422, detail="Failed to extract data from bill")
-        save_bill_data_to_history(bill_data)
-        
-        # Check if retraining is needed
-        if os.path.exists('data/models/retrain_needed.txt'):
-            # For a hackathon, this can be done synchronously
-            # In production, this should be a background task
-            print("Retraining models with latest historical data")
-            retrain_models_with_history()
-        # Apply date preprocessing
-        for col in ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']:
-            if col in bill_data and bill_data[col]:
-                bill_data[col] = standardize_date_format(bill_data[col])
-        
-        # Save to our database
-        combined_path = 'data/processed/combined_bills.json'
-        try:
-            with open(combined_path, 'r') as f:
-                existing_bills = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_bills = []
-        
-        existing_bills.append(bill_data)
-        with open(combined_path, 'w') as f:
-            json.dump(existing_bills, f, indent=2, default=str)
-        
-        # Get basic user info
-        user_info = {
-            "account_number": bill_data.get('account_number'),
-            "customer_name": bill_data.get('customer_name')
-        }
-        
-        # Detect anomalies
-        anomalies = anomaly_detector.detect_anomalies(bill_data)
-        
-        # Generate predictions
-        predictions = []
-        try:
-            # Create a dataframe from the bill data
-            df = pd.DataFrame([bill_data])
-            
-            # Convert date columns to datetime
-            date_columns = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
-            for col in date_columns:
-                if col in df.columns and df[col].iloc[0]:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+# Get the status (and result) of a background job
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, services: ServiceContainer = Depends(get_services)):
+    job = services.job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job.to_dict()
+
+# Follow a background job as server-sent events: "stage" events as it
+# progresses, partial results (extracted, anomalies, predictions,
+# recommendations) as they become available, then "succeeded" or "failed"
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str, request: Request,
+                         last_event_id: Optional[str] = Header(None),
+                         services: ServiceContainer = Depends(get_services)):
+    job = services.job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    # A reconnecting EventSource resumes after the last event it received
+    position = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    
+    async def generate():
+        nonlocal position
+        quiet_since = time.monotonic()
+        while True:
+            events = job.events_since(position)
+            for event in events:
+                yield format_event(event)
+                if event['event'] in ('succeeded', 'failed'):
+                    return
+            position += len(events)
             
-            # Get usage predictions
-            usage_predictions = prediction_service.usage_predictor.predict(df, future_months=future_months)
+            if events:
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since > JOB_EVENTS_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                quiet_since = time.monotonic()
             
-            if usage_predictions is not None:
-                # For each predicted month
-                for _, row in usage_predictions.iterrows():
-                    # Get the predicted kWh
-                    kwh_prediction = row['predicted_kwh']
-                    
-                    # Calculate the cost based on predicted kWh
-                    cost_prediction = prediction_service.cost_predictor.predict_cost(kwh_prediction)
-                    
-                    if cost_prediction:
-                        # Add prediction to results
-                        predictions.append({
-                            "prediction_date": row['prediction_date'],
-                            "predicted_kwh": kwh_prediction,
-                            "total_bill_amount": cost_prediction['total_bill_amount'],
-                            "utility_charges": cost_prediction['utility_charges'],
-                            "supplier_charges": cost_prediction['supplier_charges']
-                        })
-        except Exception as e:
-            print(f"Error generating predictions: {str(e)}")
-        
-        # Generate AI recommendations using Gemini
-        ai_recommendations = recommendation_service.generate_insights(bill_data, predictions, anomalies)
-        
-        # Return response with all components
-        response = {
-            "user_info": user_info,
-            "predictions": predictions,
-            "ai_recommendations": ai_recommendations
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+    
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def format_event(event):
+    """Format a job event as a server-sent event"""
+    data = json.dumps(jsonable_encoder(event['data']), default=str)
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+@time_stage('extraction')
+def extract_uploaded_bill(file_path, file_sha256):
+    """
+    Extract bill data from a stored upload (repeat extractions come from the
+    extraction cache, keyed on the digest save_upload computed)
+    """
+    # Imported on first use - it pulls in the Gemini client and PDF rendering
+    from scripts.direct_gemini_extraction import extract_bill_data
+    return extract_bill_data(file_path, api_key, pdf_sha256=file_sha256)
+
+def process_uploaded_bill(job, file_path, file_sha256, future_months, services):
+    """Run the upload pipeline for a saved bill PDF (in a job worker thread)"""
+    # pandas and numpy are imported where they're used, so workers start without them
+    import pandas as pd
+    
+    prediction_service = services.prediction_service
+    job.add_event('stored')
+    
+    # Extract data from the bill using Gemini (skipped if this file was seen before)
+    job.set_stage('extracting')
+    bill_data = extract_uploaded_bill(file_path, file_sha256)
+    
+    if not bill_data:
+        raise JobError("Failed to extract data from bill")
+    
+    # Apply date preprocessing
+    for col in ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']:
+        if col in bill_data and bill_data[col]:
+            bill_data[col] = standardize_date_format(bill_data[col])
+    
+    # Get basic user info
+    user_info = {
+        "account_number": bill_data.get('account_number'),
+        "customer_name": bill_data.get('customer_name')
+    }
+    job.add_event('extracted', {
+        "user_info": user_info,
+        "current_bill": {
+            "kwh_used": bill_data.get('kwh_used'),
+            "total_bill_amount": bill_data.get('total_bill_amount')
         }
+    })
+    
+    # Save to our database (also the history used for retraining)
+    job.set_stage('saving')
+    if not save_bill_data_to_history(bill_data):
+        raise JobError("Failed to save the extracted bill")
+    
+    # Check if retraining is needed
+    if os.path.exists('data/models/retrain_needed.txt'):
+        job.set_stage('retraining')
+        print("Retraining models with latest historical data")
+        services.retrain()
+    
+    # Detect anomalies
+    job.set_stage('analyzing')
+    anomalies = services.anomaly_detector.detect_anomalies(bill_data)
+    reported_anomalies = anomalies or [{"type": "info", "description": "No anomalies detected in your bill.", "severity": "low"}]
+    job.add_event('anomalies', {"anomalies": reported_anomalies})
+    
+    # Generate predictions
+    predictions = []
+    try:
+        # Create a dataframe from the bill data
+        df = pd.DataFrame([bill_data])
         
-        # Add anomalies if any were found
-        if anomalies:
-            response["anomalies"] = anomalies
-        else:
-            response["anomalies"] = [{"type": "info", "description": "No anomalies detected in your bill.", "severity": "low"}]
+        # Convert date columns to datetime
+        date_columns = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
+        for col in date_columns:
+            if col in df.columns and df[col].iloc[0]:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
         
-        return response
+        # Get usage predictions
+        usage_predictions = prediction_service.usage_predictor.predict(df, future_months=future_months)
         
+        if usage_predictions is not None:
+            # For each predicted month
+            for _, row in usage_predictions.iterrows():
+                # Get the predicted kWh
+                kwh_prediction = row['predicted_kwh']
+                
+                # Calculate the cost based on predicted kWh
+                cost_prediction = prediction_service.cost_predictor.predict_cost(kwh_prediction)
+                
+                if cost_prediction:
+                    # Add prediction to results
+                    predictions.append({
+                        "prediction_date": row['prediction_date'],
+                        "predicted_kwh": kwh_prediction,
+                        "total_bill_amount": cost_prediction['total_bill_amount'],
+                        "utility_charges": cost_prediction['utility_charges'],
+                        "supplier_charges": cost_prediction['supplier_charges']
+                    })
     except Exception as e:
-        print(f"Error in upload endpoint: {str(e)}")
-        import traceback
-        print(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"Error generating predictions: {str(e)}")
+    job.add_event('predictions', {"predictions": predictions})
+    
+    # Generate AI recommendations using Gemini
+    job.set_stage('recommending')
+    ai_recommendations = recommendation_service.generate_insights(bill_data, predictions, anomalies)
+    job.add_event('recommendations', {"ai_recommendations": ai_recommendations})
+    
+    # Return response with all components
+    return {
+        "user_info": user_info,
+        "predictions": predictions,
+        "ai_recommendations": ai_recommendations,
+        "anomalies": reported_anomalies
+    }
+
 # Helper function for AI recommendations
 def generate_recommendations(bill_data, anomalies):
     """Generate recommendations based on bill data and anomalies"""
@@ -414,10 +402,10 @@ def generate_recommendations(bill_data, anomalies):
 
     # Add new endpoint for manual retraining
 @app.post("/api/retrain")
-async def retrain_models():
+async def retrain_models(services: ServiceContainer = Depends(get_services)):
     """Manually trigger model retraining"""
     try:
-        success = retrain_models_with_history()
+        success = await services.run_blocking(services.retrain)
         if success:
             return {"message": "Models retrained successfully with historical data"}
         else:
@@ -425,10 +413,82 @@ async def retrain_models():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retraining models: {str(e)}")
 
+async def result_cache_key(services, namespace, inputs):
+    """
+    Result cache key for an endpoint's inputs
+    
+    The key includes the version of the model files on disk, checked on
+    every request, so a retrain in any worker retires the cached results.
+    
+    Args:
+        services: Service container
+        namespace: Name of the endpoint, for ResultCache.make_key
+        inputs: JSON-serializable inputs the result depends on
+    
+    Returns:
+        The key
+    """
+    model_version = await services.run_blocking(services.current_model_version)
+    return services.result_cache.make_key(namespace, inputs, model_version)
+
+async def cached_result(services, key, func, *args):
+    """
+    Serve a deterministic result from the result cache, computing it in the
+    blocking-work pool on a miss
+    
+    Args:
+        services: Service container
+        key: Result cache key (from result_cache_key)
+        func: Blocking function computing the result, called with args
+    
+    Returns:
+        The result
+    """
+    result = services.result_cache.get(key)
+    if result is None:
+        result = await services.run_blocking(func, *args)
+        services.result_cache.put(key, result)
+    return result
+
+def etag_matches(etag, if_none_match):
+    """Whether an If-None-Match header matches an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
 @app.post("/api/appliances")
-async def predict_from_appliances(request: ApplianceUsageRequest):
+async def predict_from_appliances(request: ApplianceUsageRequest, services: ServiceContainer = Depends(get_services)):
     """Predict electricity usage based on appliance usage"""
+    # Results depend only on the scenario and the models, so they are cached;
+    # model inference and the Gemini call run in the blocking-work pool
+    key = await result_cache_key(services, 'appliances', jsonable_encoder(request))
+    return await cached_result(services, key, predict_appliance_usage, request, services)
+
+# The same prediction as a GET with the scenario in the query string, so
+# simulator clients can revalidate: the result cache key is the ETag, and a
+# request with a matching If-None-Match gets an empty 304 until the models
+# change
+@app.get("/api/appliances")
+async def get_appliance_prediction(request: ApplianceUsageRequest = Depends(),
+                                   if_none_match: Optional[str] = Header(None),
+                                   services: ServiceContainer = Depends(get_services)):
+    """Predict electricity usage based on appliance usage (cacheable GET)"""
+    key = await result_cache_key(services, 'appliances', jsonable_encoder(request))
+    headers = {"ETag": f'"{key}"', "Cache-Control": "no-cache"}
+    if etag_matches(headers["ETag"], if_none_match):
+        return Response(status_code=304, headers=headers)
+    
+    result = await cached_result(services, key, predict_appliance_usage, request, services)
+    return JSONResponse(jsonable_encoder(result), headers=headers)
+
+def predict_appliance_usage(request, services):
+    """Appliance prediction (blocking)"""
+    import pandas as pd
+    
     try:
+        ml_models = services.ml_models
+        
         if 'appliance_model' not in ml_models or 'appliance_scaler' not in ml_models:
             raise HTTPException(status_code=500, detail="Appliance prediction model not loaded")
         
@@ -443,21 +503,16 @@ async def predict_from_appliances(request: ApplianceUsageRequest):
             'home_sqft': request.home_sqft
         }])
         
-        # Scale features
-        features_scaled = ml_models['appliance_scaler'].transform(features)
-        
-        # Predict
-        kwh_prediction = ml_models['appliance_model'].predict(features_scaled)[0]
+        with time_stage('appliance_inference'):
+            # Scale features
+            features_scaled = ml_models['appliance_scaler'].transform(features)
+            
+            # Predict
+            kwh_prediction = ml_models['appliance_model'].predict(features_scaled)[0]
         estimated_cost = kwh_prediction * 0.15  # $0.15 per kWh
         
         # Calculate breakdown
-        appliance_data = {
-            'air_conditioner': {'avg_wattage': 1500, 'factor': 1.0},
-            'refrigerator': {'avg_wattage': 150, 'factor': 24.0},
-            'water_heater': {'avg_wattage': 4000, 'factor': 0.9},
-            'clothes_dryer': {'avg_wattage': 3000, 'factor': 1.0},
-            'washing_machine': {'avg_wattage': 500, 'factor': 1.0}
-        }
+        appliance_data = APPLIANCE_DATA
         
         total_energy = 0
         breakdown = {}
@@ -507,6 +562,72 @@ async def predict_from_appliances(request: ApplianceUsageRequest):
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+# Predict many appliance scenarios at once (what-if sweeps)
+@app.post("/api/appliances/batch")
+def predict_from_appliances_batch(request: ApplianceBatchRequest, services: ServiceContainer = Depends(get_services)):
+    """Predict electricity usage for many appliance scenarios with one model call"""
+    import numpy as np
+    import pandas as pd
+    
+    ml_models = services.ml_models
+    
+    if 'appliance_model' not in ml_models or 'appliance_scaler' not in ml_models:
+        raise HTTPException(status_code=500, detail="Appliance prediction model not loaded")
+    if len(request.scenarios) > MAX_APPLIANCE_SCENARIOS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_APPLIANCE_SCENARIOS} scenarios per request")
+    if not request.scenarios:
+        return {"predictions": []}
+    
+    try:
+        appliances = list(APPLIANCE_DATA)
+        scenarios = request.scenarios
+        
+        # One feature row per scenario, scaled and predicted as one matrix
+        features = pd.DataFrame({
+            'air_conditioner_hours': [s.air_conditioner for s in scenarios],
+            'refrigerator_hours': [s.refrigerator for s in scenarios],
+            'electric_water_heater_hours': [s.water_heater for s in scenarios],
+            'clothes_dryer_hours': [s.clothes_dryer for s in scenarios],
+            'washing_machine_hours': [s.washing_machine for s in scenarios],
+            'household_size': [s.household_size for s in scenarios],
+            'home_sqft': [s.home_sqft for s in scenarios]
+        })
+        with time_stage('appliance_inference'):
+            features_scaled = ml_models['appliance_scaler'].transform(features)
+            kwh_predictions = np.asarray(ml_models['appliance_model'].predict(features_scaled), dtype=float)
+        
+        # Breakdowns for every scenario: each appliance's share of the expected energy
+        hours = np.array([[getattr(s, appliance) for appliance in appliances] for s in scenarios], dtype=float)
+        wattage = np.array([APPLIANCE_DATA[appliance]['avg_wattage'] for appliance in appliances])
+        factor = np.array([APPLIANCE_DATA[appliance]['factor'] for appliance in appliances])
+        used = hours > 0
+        energy = np.where(used, wattage * hours * factor * 30 / 1000, 0.0)
+        total_energy = energy.sum(axis=1, keepdims=True)
+        proportions = np.divide(energy, total_energy, out=np.zeros_like(energy), where=total_energy > 0)
+        monthly_kwh = kwh_predictions[:, None] * proportions
+        include = used & (total_energy > 0)
+        
+        predictions = []
+        for i, kwh_prediction in enumerate(kwh_predictions):
+            breakdown = {
+                appliance: {
+                    "hours_per_day": hours[i, j],
+                    "monthly_kwh": round(monthly_kwh[i, j], 2),
+                    "percentage": round(proportions[i, j] * 100, 1)
+                }
+                for j, appliance in enumerate(appliances) if include[i, j]
+            }
+            predictions.append({
+                "total_kwh": round(kwh_prediction, 2),
+                "estimated_cost": round(kwh_prediction * 0.15, 2),  # $0.15 per kWh
+                "breakdown": breakdown
+            })
+        
+        return {"predictions": predictions}
+    except Exception as e:
+        print(f"Error in batch appliance prediction: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
 
@@ -521,59 +642,72 @@ async def predict_combined(
     clothes_dryer: float = Form(0),
     washing_machine: float = Form(0),
     household_size: int = Form(3),
-    home_sqft: int = Form(1800)
+    home_sqft: int = Form(1800),
+    services: ServiceContainer = Depends(get_services)
 ):
     """Predict electricity usage using combined bill and appliance data"""
+    file_path = file_sha256 = None
+    if file:
+        # Stream the uploaded file to disk (stored by content hash)
+        try:
+            file_path, file_sha256 = await save_upload(file)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+    args = (file_path, file_sha256, bill_id, air_conditioner, refrigerator, water_heater,
+            clothes_dryer, washing_machine, household_size, home_sqft, services)
+    
+    # For a stored bill the result depends only on the bill, the appliance
+    # usage and the models, so it is cached
+    if file_path is None and bill_id:
+        bill_data = await services.run_blocking(services.bill_repository.get_bill, bill_id)
+        if bill_data is not None:
+            inputs = {
+                'bill': bill_data,
+                'appliance_usage': [air_conditioner, refrigerator, water_heater, clothes_dryer, washing_machine],
+                'household_size': household_size,
+                'home_sqft': home_sqft
+            }
+            key = await result_cache_key(services, 'combined-prediction', inputs)
+            return await cached_result(services, key, predict_combined_usage, *args)
+    
+    # Extraction, model inference and the Gemini call run in the blocking-work pool
+    return await services.run_blocking(predict_combined_usage, *args)
+
+def predict_combined_usage(file_path, file_sha256, bill_id, air_conditioner, refrigerator, water_heater,
+                           clothes_dryer, washing_machine, household_size, home_sqft, services):
+    """Combined bill and appliance prediction (blocking)"""
+    import pandas as pd
+    
     try:
+        ml_models = services.ml_models
+        
         if 'combined_model' not in ml_models or 'combined_scaler' not in ml_models:
             raise HTTPException(status_code=500, detail="Combined prediction model not loaded")
         
         bill_data = None
         
         # Handle bill data from either file upload or bill_id
-        if file:
-            # Save uploaded file
-            file_path = f"data/raw/{file.filename}"
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            
-            # Extract data from the bill using Gemini
-            bill_data = extract_bill_data(file_path, api_key)
+        if file_path is not None:
+            # Extract data from the bill using Gemini (skipped if this file was seen before)
+            bill_data = extract_uploaded_bill(file_path, file_sha256)
             
             if not bill_data:
                 raise HTTPException(status_code=422, detail="Failed to extract data from bill")
                 
-            # Save to historical dataset and our database
-            save_bill_data_to_history(bill_data)
-            
             # Apply date preprocessing
             for col in ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']:
                 if col in bill_data and bill_data[col]:
                     bill_data[col] = standardize_date_format(bill_data[col])
             
-            # Save to our database
-            combined_path = 'data/processed/combined_bills.json'
-            try:
-                with open(combined_path, 'r') as f:
-                    existing_bills = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                existing_bills = []
-            
-            existing_bills.append(bill_data)
-            with open(combined_path, 'w') as f:
-                json.dump(existing_bills, f, indent=2, default=str)
+            # Save to our database (also the history used for retraining)
+            save_bill_data_to_history(bill_data)
                 
         elif bill_id:
             # Get bill data from database using bill_id
             try:
-                with open('data/processed/combined_bills.json', 'r') as f:
-                    bills = json.load(f)
-                
-                if bill_id < 1 or bill_id > len(bills):
+                bill_data = services.bill_repository.get_bill(bill_id)
+                if bill_data is None:
                     raise HTTPException(status_code=404, detail="Bill not found")
-                
-                bill_data = bills[bill_id - 1]
             except Exception as e:
                 raise HTTPException(status_code=404, detail=f"Error retrieving bill: {str(e)}")
         else:
@@ -617,21 +751,16 @@ async def predict_combined(
             'washing_machine_hours': appliance_usage['washing_machine']
         }])
         
-        # Scale features
-        features_scaled = ml_models['combined_scaler'].transform(features)
-        
-        # Predict
-        kwh_prediction = ml_models['combined_model'].predict(features_scaled)[0]
+        with time_stage('combined_inference'):
+            # Scale features
+            features_scaled = ml_models['combined_scaler'].transform(features)
+            
+            # Predict
+            kwh_prediction = ml_models['combined_model'].predict(features_scaled)[0]
         estimated_cost = kwh_prediction * 0.15  # $0.15 per kWh
         
         # Calculate breakdown
-        appliance_data = {
-            'air_conditioner': {'avg_wattage': 1500, 'factor': 1.0},
-            'refrigerator': {'avg_wattage': 150, 'factor': 24.0},
-            'water_heater': {'avg_wattage': 4000, 'factor': 0.9},
-            'clothes_dryer': {'avg_wattage': 3000, 'factor': 1.0},
-            'washing_machine': {'avg_wattage': 500, 'factor': 1.0}
-        }
+        appliance_data = APPLIANCE_DATA
         
         total_energy = 0
         breakdown = {}
@@ -683,6 +812,59 @@ async def predict_combined(
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+def generate_appliance_recommendations(appliance_usage, kwh_prediction, breakdown):
+    """Generate AI recommendations based on appliance usage"""
+    try:
+        if not api_key:
+            return []
+        
+        # Format appliance data
+        appliance_data = "\n".join([
+            f"- {appliance.replace('_', ' ').title()}: {hours} hours/day ({breakdown.get(appliance, {}).get('percentage', 0)}% of usage)"
+            for appliance, hours in appliance_usage.items() if hours > 0
+        ])
+        
+        prompt = f"""
+        As an energy efficiency expert, analyze this household's appliance usage and provide personalized recommendations:
+        
+        Appliance Usage:
+        {appliance_data}
+        
+        Predicted Usage: {kwh_prediction} kWh per month
+        Estimated Cost: ${kwh_prediction * 0.15:.2f}
+        
+        Provide 3 specific, actionable recommendations to reduce electricity consumption and save money,
+        focusing on the appliances that use the most energy.
+        
+        Format your response as a JSON array of objects with 'title' and 'description' fields.
+        """
+        
+        # Call Gemini for personalized recommendations
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel("gemini-1.5-flash")
+        with time_stage('gemini_appliance_recommendations'):
+            response = model.generate_content(prompt)
+        
+        # Extract JSON from response
+        import re
+        import json
+        match = re.search(r'(\[[\s\S]*\])', response.text)
+        
+        if match:
+            return json.loads(match.group(1))
+        else:
+            # Fallback recommendations
+            return [
+                {
+                    "title": "Optimize Your Highest Energy Consumer",
+                    "description": "Based on your appliance usage, reducing your highest energy consuming appliance by just 10% could save you significant money on your bill."
+                }
+            ]
+    except Exception as e:
+        print(f"Error generating appliance recommendations: {str(e)}")
+        return []
+
 def generate_combined_recommendations(bill_data, appliance_usage, kwh_prediction, breakdown):
     """Generate AI recommendations based on both bill and appliance data"""
     try:
@@ -731,7 +913,8 @@ def generate_combined_recommendations(bill_data, appliance_usage, kwh_prediction
         import google.generativeai as genai
         genai.configure(api_key=api_key)
         model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
+        with time_stage('gemini_combined_recommendations'):
+            response = model.generate_content(prompt)
         
         # Extract JSON from response
         import re
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Dict, Optional, Union, Literal
 from datetime import date, datetime
 
 class BillBase(BaseModel):
@@ -33,9 +33,17 @@ class BillResponse(BillCreate):
     class Config:
         orm_mode = True
 
+class BillPage(BaseModel):
+    bills: List[Dict]
+    next_cursor: Optional[int] = Field(None, description="Pass as cursor to get the next page; null on the last page")
+
 class PredictionRequest(BaseModel):
     account_number: str
     future_months: int = Field(3, description="Number of months to predict")
+
+class BatchPredictionRequest(BaseModel):
+    account_numbers: Union[List[str], Literal['all']] = 'all'
+    future_months: int = Field(3, description="Number of months to predict")
     
 class UsagePrediction(BaseModel):
     prediction_date: date
@@ -60,7 +68,7 @@ class CompletePrediction(UsagePrediction):
 
 class PredictionResponse(BaseModel):
     account_number: str
-    predictions: List[CompletePrediction]
+    predictions: List[Dict]
 
 class AnomalyResponse(BaseModel):
     bill_id: int
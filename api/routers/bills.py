@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
-from typing import List
-import pandas as pd
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from typing import List, Optional
+from datetime import date
 import json
 import sys
 import os
@@ -8,94 +10,246 @@ import os
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from api.models.schemas import BillBase, BillCreate, BillResponse
+from api.models.schemas import BillCreate, BillResponse, BillPage
+from services.container import ServiceContainer, get_services
+from utils.data_manager import save_bills_to_history
 
 router = APIRouter()
 
-# Load data helper function
-def load_bill_data():
-    try:
-        with open('data/processed/combined_bills.json', 'r') as f:
-            return json.load(f)
-    except:
-        return []
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+# Bills validated per call by POST /api/bills/bulk, and validation errors reported
+BULK_BATCH_SIZE = 1000
+MAX_BULK_ERRORS = 100
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
 
-@router.get("/", response_model=List[BillResponse])
-async def get_all_bills():
+_bill_list_adapter = TypeAdapter(List[BillCreate])
+
+def list_bills(repository, cursor=0, limit=None, account_number=None, start_date=None, end_date=None,
+               fields=None, format='json'):
     """
-    Get all electricity bills
+    Get a page of bills, or stream every matching bill as NDJSON
+    
+    Args:
+        repository: Bill repository to read from
+        cursor: ID of the last bill of the previous page (0 to start)
+        limit: Page size (JSON) or maximum bills to stream (NDJSON)
+        account_number: Only include bills for this account
+        start_date: Only include bills dated on or after this date
+        end_date: Only include bills dated on or before this date
+        fields: Comma-separated fields to return (the id is always included)
+        format: "json" for a page, "ndjson" to stream
+        
+    Returns:
+        Dictionary with the bills and next_cursor, or a StreamingResponse
     """
-    bills = load_bill_data()
-    for i, bill in enumerate(bills):
-        bill['id'] = i + 1
-    return bills
+    if format not in ('json', 'ndjson'):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    
+    filters = {'account_number': account_number, 'start_date': start_date, 'end_date': end_date}
+    field_list = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    
+    def project(bill):
+        if not field_list:
+            return bill
+        return {'id': bill['id'], **{f: bill.get(f) for f in field_list}}
+    
+    if format == 'ndjson':
+        def generate():
+            after_id = cursor
+            remaining = limit
+            while remaining is None or remaining > 0:
+                batch_size = STREAM_BATCH_SIZE if remaining is None else min(STREAM_BATCH_SIZE, remaining)
+                batch = repository.page_bills(after_id, batch_size, **filters)
+                for bill in batch:
+                    yield json.dumps(project(bill), default=str) + '\n'
+                if len(batch) < batch_size:
+                    break
+                after_id = batch[-1]['id']
+                if remaining is not None:
+                    remaining -= len(batch)
+        
+        return StreamingResponse(generate(), media_type='application/x-ndjson')
+    
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    page = repository.page_bills(cursor, limit, **filters)
+    return {
+        'bills': [project(bill) for bill in page],
+        'next_cursor': page[-1]['id'] if len(page) == limit else None
+    }
+
+@router.get("", response_model=BillPage)
+def get_all_bills(
+    cursor: int = 0,
+    limit: Optional[int] = None,
+    account_number: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    fields: Optional[str] = None,
+    format: str = 'json',
+    services: ServiceContainer = Depends(get_services)
+):
+    """
+    Get electricity bills, paginated by cursor (or streamed as NDJSON with format=ndjson)
+    """
+    return list_bills(services.bill_repository, cursor, limit, account_number, start_date, end_date,
+                      fields, format)
 
-@router.get("/{bill_id}", response_model=BillResponse)
-async def get_bill(bill_id: int):
+@router.get("/{bill_id}")
+def get_bill(bill_id: int, services: ServiceContainer = Depends(get_services)):
     """
     Get a specific bill by ID
     """
-    bills = load_bill_data()
-    if bill_id < 1 or bill_id > len(bills):
+    bill = services.bill_repository.get_bill(bill_id)
+    if bill is None:
         raise HTTPException(status_code=404, detail="Bill not found")
     
-    bill = bills[bill_id - 1]
-    bill['id'] = bill_id
     return bill
 
-@router.post("/", response_model=BillResponse)
-async def create_bill(bill: BillCreate):
+@router.post("", response_model=BillResponse)
+def create_bill(bill: BillCreate, services: ServiceContainer = Depends(get_services)):
     """
     Add a new bill
     """
-    bills = load_bill_data()
-    
     # Convert to dict for storage
     new_bill = bill.dict()
-    bills.append(new_bill)
     
-    # Save back to file
-    with open('data/processed/combined_bills.json', 'w') as f:
-        json.dump(bills, f, indent=2, default=str)
+    # Save through the repository
+    bill_id = services.bill_repository.add_bill(new_bill, source='api')
     
     # Return with ID
-    new_bill['id'] = len(bills)
+    new_bill['id'] = bill_id
     return new_bill
 
-@router.post("/upload", response_model=BillResponse)
-async def upload_bill_pdf(file: UploadFile = File(...)):
+@router.post("/bulk")
+async def create_bills_bulk(request: Request, services: ServiceContainer = Depends(get_services)):
     """
-    Upload a bill PDF for processing
+    Add many bills at once, sent as NDJSON (one bill per line, with an NDJSON
+    content type) or as a JSON array
+    
+    The bills are validated in batches; if any is invalid nothing is stored
+    and the errors are returned with each bill's position in the payload.
+    Otherwise they are deduplicated and stored with a single write, and one
+    retraining job is queued if the new bills call for it.
     """
-    # Save uploaded PDF
-    filename = f"data/raw/{file.filename}"
-    with open(filename, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
-    
-    # Here you would call your extraction service
-    # For now, just return a placeholder
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    bills = []
+    errors = []
+    received = 0
+    
+    async def validate(items, lines=False):
+        nonlocal received
+        valid, batch_errors = await services.run_blocking(validate_bills, items, received, lines)
+        received += len(items)
+        errors.extend(batch_errors[:MAX_BULK_ERRORS - len(errors)])
+        if not errors:
+            bills.extend(valid)
+    
+    if content_type in NDJSON_CONTENT_TYPES:
+        # Validated as the body streams in, so lines never pile up unparsed
+        batch = []
+        async for line in read_lines(request):
+            batch.append(line)
+            if len(batch) == BULK_BATCH_SIZE:
+                await validate(batch, lines=True)
+                batch = []
+                if len(errors) >= MAX_BULK_ERRORS:
+                    break
+        if batch and len(errors) < MAX_BULK_ERRORS:
+            await validate(batch, lines=True)
+    else:
+        try:
+            items = await services.run_blocking(json.loads, await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of bills or NDJSON")
+        for start in range(0, len(items), BULK_BATCH_SIZE):
+            await validate(items[start:start + BULK_BATCH_SIZE])
+            if len(errors) >= MAX_BULK_ERRORS:
+                break
+    
+    if errors:
+        raise HTTPException(status_code=422, detail={"message": "No bills were stored", "errors": errors})
+    
+    # One deduplicating append (or transaction) for the whole payload. The
+    # store reports how many bills it inserted itself, so concurrent writers
+    # can't make added exceed the payload or duplicates go negative
+    added = await services.run_blocking(save_bills_to_history, bills, 'api')
+    duplicates = len(bills) - added
+    
+    # Retrain once for the whole payload rather than per bill
+    retrain_job = None
+    if added and os.path.exists('data/models/retrain_needed.txt'):
+        retrain_job = services.job_manager.submit('retrain', retrain_models, services)
+    
     return {
-        "id": 0,
-        "account_number": "placeholder",
-        "bill_date": "2025-01-01",
-        "billing_start_date": "2025-01-01", 
-        "billing_end_date": "2025-01-31",
-        "days_in_billing_period": 31,
-        "kwh_used": 0,
-        "meter_start_value": 0,
-        "meter_end_value": 0,
-        "avg_daily_usage": 0,
-        "avg_daily_temperature": 0,
-        "total_bill_amount": 0,
-        "utility_price_to_compare": 0,
-        "supplier_rate": 0,
-        "customer_charge": 0,
-        "distribution_related_component": 0,
-        "cost_recovery_charges": 0,
-        "consumer_rate_credit": 0,
-        "distribution_credit": 0,
-        "non_standard_credit": 0,
-        "utility_charges": 0,
-        "supplier_charges": 0
-    }
\ No newline at end of file
+        "received": len(bills),
+        "added": added,
+        "duplicates": duplicates,
+        "retrain_job_id": retrain_job.id if retrain_job else None
+    }
+
+async def read_lines(request):
+    """Yield the non-empty lines of a request body as it streams in"""
+    buffer = b''
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+def validate_bills(items, first_index=0, lines=False):
+    """
+    Validate a batch of bills
+    
+    Args:
+        items: Elements of a JSON array, or NDJSON lines if lines is set
+        first_index: Position of the first item in the whole payload
+        lines: Parse each item as a line of NDJSON first
+        
+    Returns:
+        Tuple of (valid bills as JSON-ready dictionaries, errors), where each
+        error has the bill's "index" in the payload and an "error" message
+    """
+    errors = []
+    parsed = []
+    positions = []
+    for offset, item in enumerate(items):
+        if lines:
+            try:
+                item = json.loads(item)
+            except ValueError as e:
+                errors.append({"index": first_index + offset, "error": f"Invalid JSON: {str(e)}"})
+                continue
+        if not isinstance(item, dict):
+            errors.append({"index": first_index + offset, "error": "Expected a JSON object"})
+            continue
+        parsed.append(item)
+        positions.append(first_index + offset)
+    
+    try:
+        bills = _bill_list_adapter.validate_python(parsed)
+    except ValidationError as e:
+        for error in e.errors():
+            location = error['loc']
+            index = positions[location[0]] if location and isinstance(location[0], int) else first_index
+            field = '.'.join(str(part) for part in location[1:])
+            errors.append({"index": index, "error": f"{field}: {error['msg']}" if field else error['msg']})
+        return [], sorted(errors, key=lambda error: error['index'])
+    
+    if errors:
+        return [], sorted(errors, key=lambda error: error['index'])
+    return _bill_list_adapter.dump_python(bills, mode='json'), []
+
+def retrain_models(job, services):
+    """Retrain the models after a bulk import (in a job worker thread)"""
+    job.set_stage('retraining')
+    return {"retrained": services.retrain()}
@@ -1,58 +1,105 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+import json
 import sys
 import os
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from api.models.schemas import PredictionRequest, PredictionResponse
-from services.prediction_service import PredictionService
+from api.models.schemas import PredictionRequest, BatchPredictionRequest, PredictionResponse
+from services.container import ServiceContainer, get_services
 
 router = APIRouter()
 
-# Dependency to get prediction service
-def get_prediction_service():
-    return PredictionService()
+# Accounts predicted per model call by /api/predictions/batch
+PREDICTION_BATCH_SIZE = 500
 
-@router.post("/", response_model=PredictionResponse)
-async def predict_future_bills(
+def format_predictions(usage_predictions, cost_predictor):
+    """Add cost predictions to a usage predictions DataFrame, in the API response format"""
+    predictions = []
+    for _, row in usage_predictions.iterrows():
+        kwh_prediction = row['predicted_kwh']
+        cost_prediction = cost_predictor.predict_cost(kwh_prediction)
+        
+        if cost_prediction:
+            predictions.append({
+                "prediction_date": row['prediction_date'],
+                "predicted_kwh": kwh_prediction,
+                "lower_bound": row['lower_bound'],
+                "upper_bound": row['upper_bound'],
+                "avg_daily_temperature": row['avg_daily_temperature'],
+                "total_bill_amount": cost_prediction['total_bill_amount'],
+                "utility_charges": cost_prediction['utility_charges'],
+                "supplier_charges": cost_prediction['supplier_charges']
+            })
+    return predictions
+
+@router.post("", response_model=PredictionResponse)
+def predict_future_bills(
     request: PredictionRequest,
-    prediction_service: PredictionService = Depends(get_prediction_service)
+    services: ServiceContainer = Depends(get_services)
 ):
     """
     Predict future bills for an account
     """
-    predictions = prediction_service.predict_future_bills(
-        request.account_number, 
-        request.future_months
-    )
+    prediction_service = services.prediction_service
+    
+    # Load the account's history (cached across requests)
+    df = services.history_provider.get(request.account_number)
+    if df is None:
+        raise HTTPException(status_code=404, detail=f"No data found for account {request.account_number}")
     
-    if 'error' in predictions:
-        raise HTTPException(status_code=404, detail=predictions['error'])
+    try:
+        # Generate usage predictions
+        usage_predictions = prediction_service.usage_predictor.predict(df, future_months=request.future_months)
+        if usage_predictions is None:
+            raise HTTPException(status_code=500, detail="Failed to generate usage predictions")
+        
+        # Generate cost predictions
+        predictions = format_predictions(usage_predictions, prediction_service.cost_predictor)
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=str(e))
     
-    # Format the response according to our schema
-    response = {
+    return {
         'account_number': request.account_number,
-        'predictions': []
+        'predictions': predictions
     }
+
+@router.post("/batch")
+def predict_future_bills_batch(
+    request: BatchPredictionRequest,
+    services: ServiceContainer = Depends(get_services)
+):
+    """
+    Predict future bills for many accounts, streamed as NDJSON (one line per account)
+    """
+    if request.account_numbers == 'all':
+        account_numbers = services.bill_repository.account_numbers()
+    else:
+        account_numbers = request.account_numbers
     
-    for pred in predictions['predictions']:
-        # Create cost prediction
-        cost_pred = pred.copy()
-        for key in ['prediction_date', 'predicted_kwh', 'kwh_lower_bound', 'kwh_upper_bound']:
-            if key in cost_pred:
-                del cost_pred[key]
-        
-        # Create complete prediction
-        complete_pred = {
-            'prediction_date': pred['prediction_date'],
-            'predicted_kwh': pred['predicted_kwh'],
-            'lower_bound': pred.get('kwh_lower_bound', pred['predicted_kwh'] * 0.85),
-            'upper_bound': pred.get('kwh_upper_bound', pred['predicted_kwh'] * 1.15),
-            'avg_daily_temperature': pred.get('avg_daily_temperature'),
-            'cost': cost_pred
-        }
-        
-        response['predictions'].append(complete_pred)
+    prediction_service = services.prediction_service
+    
+    def generate():
+        # Each chunk of accounts is predicted with a single model call
+        for start in range(0, len(account_numbers), PREDICTION_BATCH_SIZE):
+            chunk = account_numbers[start:start + PREDICTION_BATCH_SIZE]
+            histories = {account: services.history_provider.get(account) for account in chunk}
+            usage_predictions = prediction_service.usage_predictor.predict_many(histories, future_months=request.future_months)
+            
+            for account in chunk:
+                if histories[account] is None:
+                    line = {"account_number": account, "error": f"No data found for account {account}"}
+                elif usage_predictions is None:
+                    line = {"account_number": account, "error": "Failed to generate usage predictions"}
+                else:
+                    line = {
+                        "account_number": account,
+                        "predictions": format_predictions(usage_predictions[account], prediction_service.cost_predictor)
+                    }
+                yield json.dumps(line, default=str) + '\n'
     
-    return response
\ No newline at end of file
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
@@ -0,0 +1,51 @@
+# config.py
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Bill storage backend: "json" (snapshot + append-only log) or "sql"
+BILL_STORE_BACKEND = os.getenv('BILL_STORE_BACKEND', 'json')
+
+# Seconds between checks of the JSON bill files for writes by other
+# workers (0 = check before every read; a check is two stat() calls)
+BILL_CACHE_REFRESH_INTERVAL = float(os.getenv('BILL_CACHE_REFRESH_INTERVAL', '0'))
+
+# Database settings for the "sql" backend
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///data/processed/bills.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+# Memory budget in bytes for per-account history frames cached for predictions
+HISTORY_CACHE_MAX_BYTES = int(os.getenv('HISTORY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Sources included in the training view of the bill store (empty = all sources)
+TRAINING_SOURCES = [s for s in os.getenv('TRAINING_SOURCES', '').split(',') if s]
+
+# Background jobs (uploads): worker threads, and finished jobs kept for status polling
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_HISTORY_SIZE = int(os.getenv('JOB_HISTORY_SIZE', '1000'))
+
+# Where job status and progress events are written, so any worker process can
+# answer GET /api/jobs/{id} and its event stream. Leave empty to keep jobs in
+# memory only, which needs a single worker or sticky routing of job requests.
+JOB_STORE_DIR = os.getenv('JOB_STORE_DIR', 'data/jobs')
+
+# Threads for the sync API endpoints (bill lookups, predictions, anomalies)
+API_THREADPOOL_SIZE = int(os.getenv('API_THREADPOOL_SIZE', '40'))
+
+# Threads for slow blocking work in async endpoints (Gemini calls, appliance
+# and combined predictions, retraining), kept separate so it can't take
+# every thread from the quick endpoints
+BLOCKING_WORKERS = int(os.getenv('BLOCKING_WORKERS', '4'))
+
+# Cached results of deterministic prediction endpoints: most entries kept, and seconds each stays valid
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '3600'))
+
+# Largest accepted bill upload in bytes
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+
+# Load the ML models in the background at startup instead of on first use
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', 'true').lower() in ('1', 'true', 'yes')
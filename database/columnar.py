@@ -0,0 +1,141 @@
+# database/columnar.py
+import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from database.repository import get_bill_repository, json_store_stamp, _parse_date
+
+SNAPSHOT_PATH = 'data/processed/bills.parquet'
+
+DATE_COLUMNS = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
+NUMERIC_COLUMNS = [
+    'days_in_billing_period', 'kwh_used', 'meter_start_value', 'meter_end_value',
+    'avg_daily_usage', 'avg_daily_temperature', 'total_bill_amount',
+    'utility_price_to_compare', 'supplier_rate', 'customer_charge',
+    'distribution_related_component', 'cost_recovery_charges', 'consumer_rate_credit',
+    'distribution_credit', 'non_standard_credit', 'utility_charges', 'supplier_charges'
+]
+
+
+def _store_stamp():
+    """Version stamp of the bill store (and training view settings)"""
+    if config.BILL_STORE_BACKEND == 'json':
+        # Stat the files instead of constructing (and parsing) the repository
+        stamp = json_store_stamp()
+    else:
+        stamp = get_bill_repository().stamp()
+    return f"{stamp}|training={','.join(config.TRAINING_SOURCES)}"
+
+
+def build_bill_frame(repository=None):
+    """
+    Build a typed DataFrame of every stored bill
+
+    Dates are datetime64 and numeric fields float64. The boolean
+    "in_training" column marks the bills in the store's training view.
+
+    Args:
+        repository: Bill repository, defaults to the shared one
+
+    Returns:
+        DataFrame with one row per bill
+    """
+    import pandas as pd
+
+    repository = repository or get_bill_repository()
+    # One read, so a concurrent append can't leave the two out of step
+    bills, training_ids = repository.bills_with_training_ids()
+
+    df = pd.DataFrame(bills)
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col].map(_parse_date), errors='coerce')
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in df.columns:
+        if df[col].dtype == object:
+            # Parquet needs one type per column; stringify anything mixed
+            df[col] = df[col].map(lambda v: None if v is None else str(v))
+
+    df['in_training'] = [bill['id'] in training_ids for bill in bills]
+    return df
+
+
+def write_columnar_snapshot(repository=None, path=SNAPSHOT_PATH):
+    """
+    Write the typed Parquet snapshot of the bill store
+
+    Args:
+        repository: Bill repository, defaults to the shared one
+        path: Where to write the snapshot
+
+    Returns:
+        The DataFrame that was written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    stamp = _store_stamp()
+    df = build_bill_frame(repository)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'bill_store_stamp': stamp.encode()})
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Wrote columnar snapshot of {len(df)} bills to {path}")
+    return df
+
+
+def load_bill_frame(columns=None, view='serving', path=SNAPSHOT_PATH):
+    """
+    Load bills as a typed DataFrame from the columnar snapshot
+
+    The snapshot is memory-mapped and only the requested columns are
+    read. If it is missing or older than the bill store it is rebuilt
+    first.
+
+    Args:
+        columns: Columns to read (None for all)
+        view: "serving" for every bill, "training" for the training view
+        path: Snapshot path
+
+    Returns:
+        DataFrame of bills
+    """
+    import pandas as pd
+
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("pyarrow is not installed - building bill DataFrame without a snapshot")
+        df = build_bill_frame()
+        if view == 'training':
+            df = df[df['in_training']].reset_index(drop=True)
+        df = df.drop(columns=['in_training'])
+        return df[[c for c in columns if c in df.columns]] if columns else df
+
+    stamp = None
+    if os.path.exists(path):
+        metadata = pq.read_schema(path).metadata or {}
+        stamp = metadata.get(b'bill_store_stamp', b'').decode()
+
+    if stamp != _store_stamp():
+        write_columnar_snapshot(path=path)
+
+    read_columns = None
+    if columns is not None:
+        available = pq.read_schema(path).names
+        read_columns = [c for c in columns if c in available]
+        if view == 'training':
+            read_columns.append('in_training')
+
+    df = pd.read_parquet(path, columns=read_columns, memory_map=True)
+    if view == 'training':
+        df = df[df['in_training']].reset_index(drop=True)
+    return df.drop(columns=['in_training'], errors='ignore')
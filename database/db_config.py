@@ -0,0 +1,71 @@
+# database/db_config.py
+import os
+import sys
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+def create_db_engine(database_url=None):
+    """
+    Create a pooled SQLAlchemy engine
+
+    Args:
+        database_url: SQLAlchemy URL, defaults to config.DATABASE_URL
+
+    Returns:
+        SQLAlchemy Engine
+    """
+    database_url = database_url or config.DATABASE_URL
+
+    if not database_url.startswith('sqlite'):
+        return create_engine(
+            database_url,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_pre_ping=True
+        )
+
+    if database_url in ('sqlite://', 'sqlite:///:memory:'):
+        # An in-memory database only exists on a single connection
+        return create_engine(
+            database_url,
+            poolclass=StaticPool,
+            connect_args={'check_same_thread': False}
+        )
+
+    # Make sure the directory for the database file exists
+    db_path = database_url.split(':///', 1)[-1]
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+
+    engine = create_engine(
+        database_url,
+        poolclass=QueuePool,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        connect_args={'check_same_thread': False, 'timeout': config.DB_POOL_TIMEOUT}
+    )
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers in other workers proceed while one worker writes
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    return engine
+
+
+def create_session_factory(engine):
+    """Create a session factory bound to an engine"""
+    return sessionmaker(bind=engine, expire_on_commit=False)
@@ -0,0 +1,69 @@
+# database/models.py
+from datetime import date, datetime
+from sqlalchemy import Column, Integer, String, Float, Date, Index
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+DATE_COLUMNS = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
+
+
+class Bill(Base):
+    """Stored electricity bill (same fields as api.models.schemas.BillCreate)"""
+    __tablename__ = 'bills'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Nullable like the JSON store: extraction doesn't always find an account number
+    account_number = Column(String(64))
+    customer_name = Column(String(255))
+
+    # Where the bill came from ("combined", "history", "upload", "api", ...)
+    source = Column(String(32), nullable=False, default='combined', index=True)
+    # Hash of (account_number, bill_date, kwh_used); NULL for legacy duplicates
+    dedup_key = Column(String(40), unique=True)
+
+    # Billing period
+    bill_date = Column(Date)
+    billing_start_date = Column(Date)
+    billing_end_date = Column(Date)
+    due_date = Column(Date)
+    days_in_billing_period = Column(Integer)
+
+    # Usage
+    kwh_used = Column(Float)
+    meter_start_value = Column(Float)
+    meter_end_value = Column(Float)
+    avg_daily_usage = Column(Float)
+    avg_daily_temperature = Column(Float)
+
+    # Charges
+    total_bill_amount = Column(Float)
+    utility_price_to_compare = Column(Float)
+    supplier_rate = Column(Float)
+    customer_charge = Column(Float)
+    distribution_related_component = Column(Float)
+    cost_recovery_charges = Column(Float)
+    consumer_rate_credit = Column(Float)
+    distribution_credit = Column(Float, default=0.0)
+    non_standard_credit = Column(Float, default=0.0)
+    utility_charges = Column(Float)
+    supplier_charges = Column(Float)
+
+    __table_args__ = (
+        Index('ix_bills_account_number_bill_date', 'account_number', 'bill_date'),
+    )
+
+    @classmethod
+    def column_names(cls):
+        """Names of the bill fields (all columns except the primary and dedup keys)"""
+        return [c.name for c in cls.__table__.columns if c.name not in ('id', 'dedup_key')]
+
+    def to_dict(self):
+        """Convert to the bill dictionary format used by the API"""
+        bill = {'id': self.id}
+        for name in self.column_names():
+            value = getattr(self, name)
+            if isinstance(value, (date, datetime)):
+                value = value.strftime('%Y-%m-%d')
+            bill[name] = value
+        return bill
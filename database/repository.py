@@ -0,0 +1,1135 @@
+import os
+import sys
+import json
+import time
+import heapq
+import bisect
+import hashlib
+import atexit
+import threading
+import contextlib
+from datetime import date, datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows - only in-process locking is available
+    fcntl = None
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from utils.date_utils import standardize_date_format
+from utils.metrics import time_stage
+
+# Source recorded on bills stored before sources were tracked
+DEFAULT_SOURCE = 'combined'
+
+# Numeric columns materialized in the per-account time series
+SERIES_COLUMNS = ['kwh_used', 'avg_daily_temperature', 'days_in_billing_period']
+
+# Files of the JSON bill store
+BILLS_PATH = 'data/processed/combined_bills.json'
+BILLS_LOG_PATH = 'data/processed/combined_bills.log.jsonl'
+
+
+def _file_stamp(path):
+    """(mtime, size) of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def json_store_stamp(data_path=BILLS_PATH, log_path=BILLS_LOG_PATH):
+    """Cheap version stamp of the JSON bill store that changes on every write"""
+    return f"json:{_file_stamp(data_path)}:{_file_stamp(log_path)}"
+
+
+class FileLock:
+    def __init__(self, path):
+        """
+        Advisory inter-process lock on a lock file (flock)
+
+        The lock is re-entrant within one holder, so a writer that already
+        holds it can call other locking methods. Callers serialize their
+        own threads (BillRepository holds its RLock around every use).
+
+        Args:
+            path: Path of the lock file (created if missing)
+        """
+        self.path = path
+        self._file = None
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def hold(self, exclusive=True):
+        """Hold the lock for the duration of a with-block"""
+        if self._depth == 0:
+            self._file = open(self.path, 'a')
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                self._file.close()
+                self._file = None
+
+
+class BillRepository:
+    def __init__(self, data_path=BILLS_PATH, log_path=BILLS_LOG_PATH,
+                 compact_every=500, fsync_every=20, fsync_interval=1.0, refresh_interval=0.0):
+        """
+        Initialize the bill repository
+
+        Bills are stored as a JSON snapshot plus an append-only JSON-lines
+        log of bills added since the snapshot was written. Both are parsed
+        once and kept in memory together with a primary-key index
+        (bill id -> offset in the bill list), secondary indexes
+        (account number -> bill ids, and a date-sorted list of
+        (bill date, id) for date-range filters)
+        and a dedup index (bill_dedup_key -> bill id), so lookups don't
+        reparse the files and duplicate bills are never stored twice.
+
+        Each bill stores its own "id", assigned once at insert, so IDs stay
+        the same across compaction and reloads. Bills written before IDs
+        were stored get their 1-based position, which is what they were
+        addressed by before.
+
+        Before serving a read the files are stat()ed; if another process
+        has appended to the log only the new tail is read, and if the
+        snapshot was replaced everything is reloaded. `version` is bumped
+        whenever the cached bills change, so callers can key their own
+        caches on it.
+
+        Writers (appends and compaction) hold an exclusive flock on
+        "<data_path>.lock" and full reloads hold it shared, so several
+        worker processes can write the same store without losing bills or
+        handing out the same ID twice. Snapshots are replaced atomically.
+
+        Args:
+            data_path: Path to the JSON array snapshot of bills
+            log_path: Path to the append-only log of newer bills
+            compact_every: Fold the log into the snapshot after this many entries
+            fsync_every: Force the log to disk after this many appends
+            fsync_interval: ...or at most this many seconds after an append,
+                even if no further appends come
+            refresh_interval: Minimum seconds between checks of the files for
+                writes by other processes (0 checks on every read)
+        """
+        self.data_path = data_path
+        self.log_path = log_path
+        self.compact_every = compact_every
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(f"{data_path}.lock")
+        self._bills = []
+        self._by_id = {}
+        self._ids = []
+        self._next_id = 1
+        self._by_account = {}
+        self._by_key = {}
+        self._dates = {}
+        self._by_date = None
+        self._log_file = None
+        self._log_entries = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._flush_timer = None
+        self._data_stamp = None
+        self._log_offset = 0
+        self._last_refresh_check = 0.0
+        self._load()
+
+    def get_bill(self, bill_id):
+        """
+        Get a single bill by its ID
+
+        Args:
+            bill_id: 1-based bill ID
+
+        Returns:
+            Copy of the bill dictionary, or None if it doesn't exist
+        """
+        with self._lock:
+            self._refresh()
+            offset = self._by_id.get(bill_id)
+            return dict(self._bills[offset]) if offset is not None else None
+
+    def bills_for_account(self, account_number):
+        """
+        Get all bills for an account, in insertion order
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            List of bill dictionaries (empty if the account is unknown)
+        """
+        with self._lock:
+            self._refresh()
+            return [dict(self._bill(bill_id)) for bill_id in self._by_account.get(account_number, [])]
+
+    def account_series(self, account_number):
+        """
+        Get an account's bills as a date-sorted time series
+
+        Only the account's bills are read, through the account index, and
+        the series isn't cached here: callers that reuse it (the history
+        provider) cache it against account_version().
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            Dictionary of read-only arrays: "bill_date" (datetime64) plus
+            the SERIES_COLUMNS as floats (NaN where missing). Bills without
+            a usable bill date are left out.
+        """
+        with self._lock:
+            self._refresh()
+            bill_ids = self._by_account.get(account_number, [])
+            return build_series([self._bill(bill_id) for bill_id in bill_ids],
+                                [self._dates[bill_id] for bill_id in bill_ids])
+
+    def account_version(self, account_number):
+        """
+        Version of one account's bills, after picking up other processes' writes
+
+        Stored bills are never changed or removed, so the number of bills
+        and the highest ID identify the account's contents; writes to other
+        accounts leave it unchanged.
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            Tuple of (bill count, highest bill ID) for the account
+        """
+        with self._lock:
+            self._refresh()
+            bill_ids = self._by_account.get(account_number, [])
+            return len(bill_ids), bill_ids[-1] if bill_ids else 0
+
+    def all_bills(self):
+        """Get all bills, in insertion order (the serving view)"""
+        with self._lock:
+            self._refresh()
+            return [dict(bill) for bill in self._bills]
+
+    def training_bills(self):
+        """Get one bill per dedup key from the training sources (the training view)"""
+        with self._lock:
+            self._refresh()
+            return [dict(self._bill(bill_id)) for bill_id in self._training_ids()]
+
+    def bills_with_training_ids(self):
+        """
+        Get all bills and the IDs of the training view from one refresh
+
+        Returns:
+            Tuple of (all bills in insertion order, set of training view IDs)
+        """
+        with self._lock:
+            self._refresh()
+            return [dict(bill) for bill in self._bills], set(self._training_ids())
+
+    def page_bills(self, after_id=0, limit=None, account_number=None, start_date=None, end_date=None):
+        """
+        Get a page of bills in ID order, using the account index when filtering
+
+        Args:
+            after_id: Only return bills with an ID greater than this (the cursor)
+            limit: Maximum number of bills to return (None for no limit)
+            account_number: Only return bills for this account
+            start_date: Only return bills dated on or after this date
+            end_date: Only return bills dated on or before this date
+
+        Returns:
+            List of bill dictionaries, each including its "id"
+        """
+        with self._lock:
+            self._refresh()
+            after_id = max(after_id or 0, 0)
+            if account_number is not None:
+                account_ids = self._by_account.get(account_number, [])
+                candidates = account_ids[bisect.bisect_right(account_ids, after_id):]
+            elif start_date is not None or end_date is not None:
+                # Only the bills in the date range, found through the (date, id) index
+                by_date = self._date_index()
+                start = bisect.bisect_left(by_date, (start_date,)) if start_date is not None else 0
+                end = (bisect.bisect_right(by_date, (end_date, float('inf')))
+                       if end_date is not None else len(by_date))
+                in_range = (bill_id for _, bill_id in by_date[start:end] if bill_id > after_id)
+                candidates = heapq.nsmallest(limit, in_range) if limit else sorted(in_range)
+            else:
+                candidates = self._ids[bisect.bisect_right(self._ids, after_id):]
+
+            page = []
+            for bill_id in candidates:
+                if start_date is not None or end_date is not None:
+                    bill_date = self._dates.get(bill_id)
+                    if (bill_date is None or
+                            (start_date is not None and bill_date < start_date) or
+                            (end_date is not None and bill_date > end_date)):
+                        continue
+                page.append(dict(self._bill(bill_id)))
+                if limit and len(page) >= limit:
+                    break
+            return page
+
+    def account_numbers(self):
+        """Account numbers of all stored bills, sorted"""
+        with self._lock:
+            self._refresh()
+            return sorted(account for account in self._by_account if account is not None)
+
+    def bill_ids(self):
+        """IDs of all bills, in the same order as all_bills()"""
+        with self._lock:
+            self._refresh()
+            return [bill['id'] for bill in self._bills]
+
+    def training_ids(self):
+        """IDs of the bills in the training view, in insertion order"""
+        with self._lock:
+            self._refresh()
+            return self._training_ids()
+
+    def count(self):
+        """Number of stored bills"""
+        with self._lock:
+            self._refresh()
+            return len(self._bills)
+
+    def stamp(self):
+        """Version stamp that changes whenever bills are written"""
+        with self._lock:
+            return json_store_stamp(self.data_path, self.log_path)
+
+    def current_version(self):
+        """
+        The cache version after picking up writes by other processes
+
+        Unlike reading `version` directly, this checks the files first, so
+        callers keying caches on it see bills written by other workers.
+        """
+        with self._lock:
+            self._refresh()
+            return self.version
+
+    def training_count(self):
+        """Number of bills in the training view"""
+        with self._lock:
+            self._refresh()
+            return len(self._training_ids())
+
+    def add_bill(self, bill_data, source=DEFAULT_SOURCE):
+        """
+        Store a new bill and update the indexes
+
+        Args:
+            bill_data: Dictionary with bill data
+            source: Where the bill came from (e.g. "upload", "api")
+
+        Returns:
+            ID of the stored bill, or of the existing bill if it's a duplicate
+        """
+        return self.add_bills([bill_data], source)[0]
+
+    def add_bills(self, bills, source=DEFAULT_SOURCE):
+        """
+        Store many bills with a single log write, skipping duplicates
+
+        Args:
+            bills: Iterable of bill dictionaries
+            source: Where the bills came from, for bills without a "source"
+
+        Returns:
+            List of bill IDs, one per input bill (existing IDs for duplicates)
+        """
+        return self.insert_bills(bills, source)[0]
+
+    def insert_bills(self, bills, source=DEFAULT_SOURCE):
+        """
+        Store many bills like add_bills, also reporting which were new
+
+        Which bills are new is decided under the store's locks, so it stays
+        right when other threads or processes write at the same time.
+
+        Args:
+            bills: Iterable of bill dictionaries
+            source: Where the bills came from, for bills without a "source"
+
+        Returns:
+            Tuple of (bill IDs, one per input bill, IDs of the bills inserted)
+        """
+        with self._lock, self._file_lock.hold(exclusive=True):
+            # Catch up with other writers so their bills count as duplicates
+            # and new IDs continue from theirs
+            self._refresh(force=True)
+
+            keys = []
+            new_bills = []
+            new_keys = set()
+            for bill_data in bills:
+                key = bill_dedup_key(bill_data)
+                keys.append(key)
+                if key in self._by_key or key in new_keys:
+                    continue
+                bill = dict(bill_data)
+                bill.setdefault('source', source)
+                bill['id'] = self._next_id + len(new_bills)
+                new_bills.append(bill)
+                new_keys.add(key)
+
+            if new_bills:
+                if self._append_to_log(new_bills):
+                    for bill in new_bills:
+                        self._index_bill(bill)
+                    self.version += 1
+                else:
+                    # Another process appended without taking the lock; re-read the log
+                    self._load()
+
+                if self._log_entries >= self.compact_every:
+                    self.compact()
+
+            return [self._by_key[key] for key in keys], [bill['id'] for bill in new_bills]
+
+    def compact(self):
+        """Write all bills to a new snapshot and truncate the log"""
+        with self._lock, self._file_lock.hold(exclusive=True):
+            self._refresh(force=True)
+
+            tmp_path = f"{self.data_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                # One bill per line: still readable, but encoded by the C
+                # encoder (indent= forces the much slower pure-Python one)
+                f.write('[\n' + ',\n'.join(json.dumps(bill, default=str) for bill in self._bills) + '\n]\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.data_path)
+
+            # The snapshot now holds every logged bill, so start a fresh log
+            self._close_log()
+            open(self.log_path, 'w').close()
+            self._log_entries = 0
+            self._log_offset = 0
+            self._data_stamp = _file_stamp(self.data_path)
+            print(f"Compacted {len(self._bills)} bills into {self.data_path}")
+
+    def flush(self):
+        """Force any buffered log appends to disk"""
+        with self._lock:
+            if self._log_file is not None and self._unsynced:
+                self._log_file.flush()
+                os.fsync(self._log_file.fileno())
+                self._unsynced = 0
+                self._last_fsync = time.monotonic()
+
+    def close(self):
+        """Flush and close the log file"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self.flush()
+            self._close_log()
+
+    def reload(self):
+        """Re-read the bill files and rebuild the indexes"""
+        with self._lock:
+            self.flush()
+            self._load()
+
+    def _append_to_log(self, bills):
+        """
+        Append bills to the log in one write, fsyncing in batches
+
+        Returns:
+            True if the log now ends exactly with what we have indexed,
+            False if another process appended in between
+        """
+        if self._log_file is None:
+            self._log_file = open(self.log_path, 'ab')
+            if self._log_file.tell() > 0:
+                # Terminate a line torn by a crash so our entries start on a new line
+                with open(self.log_path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self._log_file.write(b'\n')
+
+        data = ''.join(json.dumps(bill, default=str) + '\n' for bill in bills).encode('utf-8')
+        self._log_file.write(data)
+        self._log_file.flush()
+        self._log_entries += len(bills)
+        self._unsynced += len(bills)
+
+        if (self._unsynced >= self.fsync_every or
+                time.monotonic() - self._last_fsync >= self.fsync_interval):
+            self.flush()
+        else:
+            self._schedule_flush()
+
+        log_size = os.fstat(self._log_file.fileno()).st_size
+        if log_size != self._log_offset + len(data):
+            return False
+        self._log_offset = log_size
+        return True
+
+    def _refresh(self, force=False):
+        """Pick up bills written to the files by other processes"""
+        now = time.monotonic()
+        if not force and self.refresh_interval and now - self._last_refresh_check < self.refresh_interval:
+            return
+        self._last_refresh_check = now
+
+        log_stamp = _file_stamp(self.log_path)
+        log_size = log_stamp[1] if log_stamp else 0
+        if _file_stamp(self.data_path) != self._data_stamp or log_size < self._log_offset:
+            # The snapshot was rewritten (compaction) - reload everything
+            self._load()
+        elif log_size > self._log_offset:
+            # Only new log entries - index just the tail
+            logged_bills, self._log_offset = self._read_log(self._log_offset)
+            for bill in logged_bills:
+                bill.setdefault('source', DEFAULT_SOURCE)
+                self._index_bill(bill)
+            self._log_entries += len(logged_bills)
+            if logged_bills:
+                self.version += 1
+
+    def _schedule_flush(self):
+        """Start a timer that fsyncs the log fsync_interval from now, if none is pending"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.fsync_interval, self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _timed_flush(self):
+        """Timer callback: fsync appends that no later append has flushed"""
+        with self._lock:
+            self._flush_timer = None
+            self.flush()
+
+    def _close_log(self):
+        """Close the log file handle if it is open"""
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    @time_stage('bill_store_load')
+    def _load(self):
+        """Load the snapshot, replay the log and build the indexes"""
+        # Hold the lock shared so a compaction can't swap the files mid-read
+        with self._file_lock.hold(exclusive=False):
+            self._data_stamp = _file_stamp(self.data_path)
+            try:
+                with open(self.data_path, 'r') as f:
+                    bills = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError) as e:
+                print(f"Error loading bill data from {self.data_path}: {e}")
+                bills = []
+
+            logged_bills, self._log_offset = self._read_log()
+
+        self._bills = []
+        self._by_id = {}
+        self._ids = []
+        self._next_id = 1
+        self._by_account = {}
+        self._by_key = {}
+        self._dates = {}
+        self._by_date = None
+        self._log_entries = len(logged_bills)
+        for bill in bills + logged_bills:
+            bill.setdefault('source', DEFAULT_SOURCE)
+            self._index_bill(bill)
+        self.version += 1
+
+    def _read_log(self, offset=0):
+        """
+        Read the bills appended to the log after a byte offset
+
+        Returns:
+            Tuple of (bills, offset just past the last complete line)
+        """
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        # A line without its newline is still being written (or was torn
+        # by a crash); leave it for the next read
+        end = data.rfind(b'\n') + 1
+        bills = []
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                bills.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable entry in {self.log_path}")
+        return bills, offset + end
+
+    def _bill(self, bill_id):
+        """Look up a bill through the ID -> offset index"""
+        return self._bills[self._by_id[bill_id]]
+
+    def _index_bill(self, bill):
+        """
+        Append a bill to self._bills and add it to the indexes
+
+        Returns:
+            The bill's ID, or None if a bill with that ID is already loaded
+        """
+        bill_id = bill.get('id')
+        if bill_id in self._by_id:
+            # Already in the snapshot (the log is truncated right after compaction)
+            return None
+        if not isinstance(bill_id, int):
+            bill_id = self._next_id
+            bill['id'] = bill_id
+        self._next_id = max(self._next_id, bill_id + 1)
+
+        self._bills.append(bill)
+        self._by_id[bill_id] = len(self._bills) - 1
+        if not self._ids or bill_id > self._ids[-1]:
+            self._ids.append(bill_id)
+            self._by_account.setdefault(bill.get('account_number'), []).append(bill_id)
+        else:
+            bisect.insort(self._ids, bill_id)
+            bisect.insort(self._by_account.setdefault(bill.get('account_number'), []), bill_id)
+        # Bills stored before deduplication may repeat a key; the first one wins
+        self._by_key.setdefault(bill_dedup_key(bill), bill_id)
+        bill_date = self._dates[bill_id] = _parse_date(bill.get('bill_date'))
+        if self._by_date is not None and bill_date is not None:
+            bisect.insort(self._by_date, (bill_date, bill_id))
+        return bill_id
+
+    def _date_index(self):
+        """(bill date, id) pairs of the dated bills, sorted; built on first use"""
+        if self._by_date is None:
+            self._by_date = sorted((bill_date, bill_id) for bill_id, bill_date in self._dates.items()
+                                   if bill_date is not None)
+        return self._by_date
+
+    def _training_ids(self):
+        """IDs of the bills in the training view, in insertion order"""
+        sources = config.TRAINING_SOURCES
+        return sorted(bill_id for bill_id in self._by_key.values()
+                      if not sources or self._bill(bill_id).get('source') in sources)
+
+
+def _to_date(value):
+    """Convert a stored or extracted date value to a date"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value)
+    try:
+        # Fast path for ISO dates and timestamps
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        standardized = standardize_date_format(value)
+        return date.fromisoformat(standardized) if standardized else None
+
+
+def _parse_date(value):
+    """Like _to_date, but returns None for unparseable values"""
+    try:
+        return _to_date(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _to_float(value):
+    """Convert a stored numeric value to a float (NaN if missing or invalid)"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def build_series(bills, bill_dates):
+    """
+    Build a date-sorted time series from one account's bills
+
+    Args:
+        bills: Bill dictionaries, in ID order
+        bill_dates: Parsed bill date (or None) for each bill
+
+    Returns:
+        Dictionary of read-only arrays, see BillRepository.account_series
+    """
+    import numpy as np
+
+    rows = [(bill_date, bill) for bill_date, bill in zip(bill_dates, bills) if bill_date is not None]
+    # Stable sort, so bills on the same date stay in ID order
+    rows.sort(key=lambda row: row[0])
+
+    series = {'bill_date': np.array([row[0] for row in rows], dtype='datetime64[D]').astype('datetime64[ns]')}
+    for column in SERIES_COLUMNS:
+        series[column] = np.array([_to_float(row[1].get(column)) for row in rows], dtype=np.float64)
+    for values in series.values():
+        values.flags.writeable = False
+    return series
+
+
+def bill_dedup_key(bill_data):
+    """Hash the fields that identify a bill (account, bill date and kWh used)"""
+    bill_date = _parse_date(bill_data.get('bill_date'))
+    kwh_used = bill_data.get('kwh_used')
+    try:
+        kwh_used = float(kwh_used)
+    except (TypeError, ValueError):
+        pass
+    raw = f"{bill_data.get('account_number')}|{bill_date or bill_data.get('bill_date')}|{kwh_used}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class SQLBillRepository:
+    def __init__(self, database_url=None, seed_path=BILLS_PATH, seed_log_path=BILLS_LOG_PATH):
+        """
+        Initialize the SQL bill repository
+
+        Serves the same interface as BillRepository from a SQL database
+        (SQLite by default). The first time an empty database is opened it
+        is seeded from the JSON bill store so switching backends keeps the
+        existing bills and their IDs. Duplicates are rejected by a unique
+        dedup_key column; legacy duplicates from the seed keep a NULL key.
+
+        Args:
+            database_url: SQLAlchemy URL, defaults to config.DATABASE_URL
+            seed_path: JSON snapshot to import into an empty database
+            seed_log_path: Append-only log to import along with the snapshot
+        """
+        from sqlalchemy import func
+        from sqlalchemy.exc import DatabaseError
+        from database.db_config import create_db_engine, create_session_factory
+        from database.models import Base, Bill
+
+        self._func = func
+        self._Bill = Bill
+        self.engine = create_db_engine(database_url)
+        self.Session = create_session_factory(self.engine)
+        try:
+            Base.metadata.create_all(self.engine)
+        except DatabaseError:
+            # Another worker created the tables between the existence check
+            # and CREATE TABLE; checking again finds them
+            Base.metadata.create_all(self.engine)
+
+        if self.count() == 0 and seed_path and (os.path.exists(seed_path) or
+                                                (seed_log_path and os.path.exists(seed_log_path))):
+            seed = BillRepository(seed_path, seed_log_path)
+            imported = self._import_bills(seed.all_bills())
+            seed.close()
+            if imported:
+                print(f"Imported {imported} bills from {seed_path} into the database")
+
+    def get_bill(self, bill_id):
+        """
+        Get a single bill by its ID
+
+        Args:
+            bill_id: 1-based bill ID
+
+        Returns:
+            Bill dictionary, or None if it doesn't exist
+        """
+        with self.Session() as session:
+            bill = session.get(self._Bill, bill_id)
+            return bill.to_dict() if bill is not None else None
+
+    def bills_for_account(self, account_number):
+        """
+        Get all bills for an account, in insertion order
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            List of bill dictionaries (empty if the account is unknown)
+        """
+        with self.Session() as session:
+            bills = (session.query(self._Bill)
+                     .filter(self._Bill.account_number == account_number)
+                     .order_by(self._Bill.id)
+                     .all())
+            return [bill.to_dict() for bill in bills]
+
+    def account_series(self, account_number):
+        """
+        Get an account's bills as a date-sorted time series
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            Dictionary of read-only arrays, see BillRepository.account_series
+        """
+        columns = [getattr(self._Bill, column) for column in SERIES_COLUMNS]
+        with self.Session() as session:
+            rows = (session.query(self._Bill.bill_date, *columns)
+                    .filter(self._Bill.account_number == account_number,
+                            self._Bill.bill_date.isnot(None))
+                    .order_by(self._Bill.bill_date, self._Bill.id)
+                    .all())
+        bills = [dict(zip(SERIES_COLUMNS, row[1:])) for row in rows]
+        return build_series(bills, [row[0] for row in rows])
+
+    def account_version(self, account_number):
+        """
+        Version of one account's bills
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            Tuple of (bill count, highest bill ID) for the account
+        """
+        with self.Session() as session:
+            count, max_id = (session.query(self._func.count(self._Bill.id), self._func.max(self._Bill.id))
+                             .filter(self._Bill.account_number == account_number)
+                             .one())
+            return count, max_id or 0
+
+    def all_bills(self):
+        """Get all bills, in insertion order (the serving view)"""
+        with self.Session() as session:
+            return [bill.to_dict() for bill in session.query(self._Bill).order_by(self._Bill.id)]
+
+    def training_bills(self):
+        """Get one bill per dedup key from the training sources (the training view)"""
+        with self.Session() as session:
+            query = self._training_query(session.query(self._Bill)).order_by(self._Bill.id)
+            return [bill.to_dict() for bill in query]
+
+    def bills_with_training_ids(self):
+        """
+        Get all bills and the IDs of the training view
+
+        The bills are read first, so a bill added in between can only show
+        up as an extra training ID, which callers ignore.
+
+        Returns:
+            Tuple of (all bills in ID order, set of training view IDs)
+        """
+        with self.Session() as session:
+            bills = [bill.to_dict() for bill in session.query(self._Bill).order_by(self._Bill.id)]
+            query = self._training_query(session.query(self._Bill.id))
+            return bills, {bill_id for (bill_id,) in query}
+
+    def page_bills(self, after_id=0, limit=None, account_number=None, start_date=None, end_date=None):
+        """
+        Get a page of bills in ID order, using the (account_number, bill_date) index
+
+        Args:
+            after_id: Only return bills with an ID greater than this (the cursor)
+            limit: Maximum number of bills to return (None for no limit)
+            account_number: Only return bills for this account
+            start_date: Only return bills dated on or after this date
+            end_date: Only return bills dated on or before this date
+
+        Returns:
+            List of bill dictionaries, each including its "id"
+        """
+        with self.Session() as session:
+            query = session.query(self._Bill).filter(self._Bill.id > (after_id or 0))
+            if account_number is not None:
+                query = query.filter(self._Bill.account_number == account_number)
+            if start_date is not None:
+                query = query.filter(self._Bill.bill_date >= start_date)
+            if end_date is not None:
+                query = query.filter(self._Bill.bill_date <= end_date)
+            query = query.order_by(self._Bill.id)
+            if limit:
+                query = query.limit(limit)
+            return [bill.to_dict() for bill in query]
+
+    def account_numbers(self):
+        """Account numbers of all stored bills, sorted"""
+        with self.Session() as session:
+            query = session.query(self._Bill.account_number).distinct().order_by(self._Bill.account_number)
+            return [account for (account,) in query]
+
+    def bill_ids(self):
+        """IDs of all bills, in the same order as all_bills()"""
+        with self.Session() as session:
+            return [bill_id for (bill_id,) in session.query(self._Bill.id).order_by(self._Bill.id)]
+
+    def training_ids(self):
+        """IDs of the bills in the training view, in insertion order"""
+        with self.Session() as session:
+            query = self._training_query(session.query(self._Bill.id)).order_by(self._Bill.id)
+            return [bill_id for (bill_id,) in query]
+
+    def count(self):
+        """Number of stored bills"""
+        with self.Session() as session:
+            return session.query(self._func.count(self._Bill.id)).scalar()
+
+    @property
+    def version(self):
+        """Changes whenever bills are written (by any process)"""
+        return self.stamp()
+
+    def current_version(self):
+        """Changes whenever bills are written (by any process)"""
+        return self.stamp()
+
+    def stamp(self):
+        """Version stamp that changes whenever bills are written"""
+        with self.Session() as session:
+            count, max_id = session.query(self._func.count(self._Bill.id), self._func.max(self._Bill.id)).one()
+            return f"sql:{count}:{max_id}"
+
+    def training_count(self):
+        """Number of bills in the training view"""
+        with self.Session() as session:
+            return self._training_query(session.query(self._func.count(self._Bill.id))).scalar()
+
+    def add_bill(self, bill_data, source=DEFAULT_SOURCE):
+        """
+        Store a new bill
+
+        Args:
+            bill_data: Dictionary with bill data
+            source: Where the bill came from (e.g. "upload", "api")
+
+        Returns:
+            ID of the stored bill, or of the existing bill if it's a duplicate
+        """
+        return self.add_bills([bill_data], source)[0]
+
+    def add_bills(self, bills, source=DEFAULT_SOURCE):
+        """
+        Store many bills in a single transaction, skipping duplicates
+
+        Args:
+            bills: Iterable of bill dictionaries
+            source: Where the bills came from, for bills without a "source"
+
+        Returns:
+            List of bill IDs, one per input bill (existing IDs for duplicates)
+        """
+        return self.insert_bills(bills, source)[0]
+
+    def insert_bills(self, bills, source=DEFAULT_SOURCE):
+        """
+        Store many bills like add_bills, also reporting which were new
+
+        Args:
+            bills: Iterable of bill dictionaries
+            source: Where the bills came from, for bills without a "source"
+
+        Returns:
+            Tuple of (bill IDs, one per input bill, IDs of the bills inserted)
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        bills = list(bills)
+        keys = [bill_dedup_key(bill) for bill in bills]
+        if not bills:
+            return [], []
+
+        for attempt in range(2):
+            with self.Session() as session:
+                bill_ids = self._existing_ids(session, set(keys))
+
+                new_rows = {}
+                for bill, key in zip(bills, keys):
+                    if key in bill_ids or key in new_rows:
+                        continue
+                    new_rows[key] = self._to_row(bill, key, source)
+
+                session.add_all(new_rows.values())
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Another worker inserted one of these bills first; retry
+                    # so it is treated as a duplicate
+                    session.rollback()
+                    if attempt:
+                        raise
+                    continue
+
+                bill_ids.update({key: row.id for key, row in new_rows.items()})
+                return [bill_ids[key] for key in keys], [row.id for row in new_rows.values()]
+
+    def flush(self):
+        """Writes are committed per call, so there is nothing to flush"""
+        pass
+
+    def close(self):
+        """Release pooled connections"""
+        self.engine.dispose()
+
+    def reload(self):
+        """Every read goes to the database, so there is nothing to reload"""
+        pass
+
+    def _import_bills(self, bills):
+        """
+        Copy bills as-is (IDs and duplicates included) into an empty database
+
+        Several workers may open a new database at once; the table is checked
+        again inside the seeding transaction and a worker that loses the race
+        (IntegrityError on the IDs it tried to insert) leaves the seed to the
+        winner. An IntegrityError that leaves the table empty is a problem
+        with the seed data itself and is raised.
+
+        Returns:
+            Number of bills imported (0 if the database was already seeded)
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        seen_keys = set()
+        rows = []
+        for bill in bills:
+            key = bill_dedup_key(bill)
+            row = self._to_row(bill, key if key not in seen_keys else None, DEFAULT_SOURCE)
+            row.id = bill.get('id')
+            rows.append(row)
+            seen_keys.add(key)
+
+        with self.Session() as session:
+            if session.query(self._func.count(self._Bill.id)).scalar():
+                return 0
+            session.add_all(rows)
+            try:
+                session.commit()
+            except IntegrityError as e:
+                session.rollback()
+                if self.count() == 0:
+                    print(f"Error seeding the bill database: {e}")
+                    raise
+                return 0
+        return len(rows)
+
+    def _existing_ids(self, session, keys, chunk_size=500):
+        """Map the dedup keys that are already stored to their bill IDs"""
+        keys = list(keys)
+        existing = {}
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            query = (session.query(self._Bill.dedup_key, self._Bill.id)
+                     .filter(self._Bill.dedup_key.in_(chunk)))
+            existing.update(dict(query))
+        return existing
+
+    def _training_query(self, query):
+        """Restrict a query to the training view"""
+        query = query.filter(self._Bill.dedup_key.isnot(None))
+        if config.TRAINING_SOURCES:
+            query = query.filter(self._Bill.source.in_(config.TRAINING_SOURCES))
+        return query
+
+    def _to_row(self, bill_data, dedup_key, source):
+        """Build a Bill row from a bill dictionary, ignoring unknown keys"""
+        values = {}
+        for name in self._Bill.column_names():
+            value = bill_data.get(name)
+            if name in ('bill_date', 'billing_start_date', 'billing_end_date', 'due_date'):
+                value = _to_date(value)
+            values[name] = value
+        values['source'] = values.get('source') or source
+        return self._Bill(dedup_key=dedup_key, **values)
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def create_bill_repository(backend=None):
+    """
+    Create a bill repository for the configured storage backend
+
+    Args:
+        backend: "json" or "sql", defaults to config.BILL_STORE_BACKEND
+
+    Returns:
+        BillRepository or SQLBillRepository
+    """
+    backend = backend or config.BILL_STORE_BACKEND
+    if backend == 'sql':
+        return SQLBillRepository()
+    if backend == 'json':
+        return BillRepository(refresh_interval=config.BILL_CACHE_REFRESH_INTERVAL)
+    raise ValueError(f"Unknown bill storage backend: {backend}")
+
+
+def import_history_file(repository, history_path='data/processed/historical_bills.json'):
+    """
+    Fold the legacy historical_bills.json file into the bill store
+
+    The bills are added with source "history" (duplicates of stored bills
+    are skipped) and a marker file is written beside it so it is only
+    imported once; the history file itself is left alone. Workers starting
+    together take an exclusive lock beside the file, so only one imports
+    it; the others find the marker.
+
+    Args:
+        repository: Bill repository to import into
+        history_path: Path to the legacy history file
+
+    Returns:
+        Number of bills read from the file
+    """
+    marker_path = f"{history_path}.imported"
+    if not os.path.exists(history_path) or os.path.exists(marker_path):
+        return 0
+
+    with FileLock(f"{history_path}.lock").hold(exclusive=True):
+        if os.path.exists(marker_path):
+            # Another worker imported it while we waited for the lock
+            return 0
+        try:
+            with open(history_path, 'r') as f:
+                historical_bills = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except json.JSONDecodeError as e:
+            print(f"Error reading legacy history file {history_path}: {e}")
+            return 0
+
+        for bill in historical_bills:
+            for col in ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']:
+                if bill.get(col):
+                    bill[col] = standardize_date_format(str(bill[col]))
+
+        repository.add_bills(historical_bills, source='history')
+        with open(marker_path, 'w') as f:
+            json.dump({'bills': len(historical_bills), 'imported_at': datetime.now().isoformat()}, f)
+    print(f"Imported {len(historical_bills)} bills from {history_path} into the bill store")
+    return len(historical_bills)
+
+
+def get_bill_repository():
+    """Get the shared bill repository, creating it on first use"""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                repository = create_bill_repository()
+                import_history_file(repository)
+                atexit.register(repository.close)
+                _repository = repository
+    return _repository
@@ -0,0 +1,31 @@
+import os
+import pickle
+import threading
+
+# Held while unpickling any model. Unpickling imports sklearn's submodules
+# on first use, and two threads doing that at once can fail with
+# "deadlock detected by _ModuleLock(...)"; it also keeps a model and its
+# scaler from being seen half-loaded. Re-entrant so a caller can hold it
+# across several loads.
+MODEL_LOAD_LOCK = threading.RLock()
+
+# Raised by pickle.load for a truncated or otherwise unreadable model file
+PICKLE_LOAD_ERRORS = (EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError)
+
+
+def save_pickle(obj, path):
+    """
+    Pickle an object to a file atomically
+
+    The pickle is written to a temporary file beside the target and moved
+    into place, so a worker reloading the models never reads a half-written
+    file.
+
+    Args:
+        obj: Object to pickle
+        path: Path of the model file
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(tmp_path, path)
@@ -1,8 +1,14 @@
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
 import pickle
 import os
+import sys
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import time_stage
+from ml_models import MODEL_LOAD_LOCK, PICKLE_LOAD_ERRORS, save_pickle
 
 class AnomalyDetector:
     def __init__(self, model_dir='models'):
@@ -36,6 +42,7 @@ class AnomalyDetector:
         features = [f for f in features if f in df.columns]
         
         if len(features) > 0:
+            from sklearn.ensemble import IsolationForest
             X = df[features]
             self.model = IsolationForest(contamination=0.1, random_state=42)
             self.model.fit(X)
@@ -45,6 +52,7 @@ class AnomalyDetector:
         
         return True
     
+    @time_stage('anomaly_inference')
     def detect_anomalies(self, bill_data):
         """
         Detect anomalies in a bill
@@ -123,11 +131,9 @@ class AnomalyDetector:
         thresholds_path = os.path.join(self.model_dir, 'anomaly_detector_thresholds.pkl')
         
         if self.model is not None:
-            with open(model_path, 'wb') as f:
-                pickle.dump(self.model, f)
+            save_pickle(self.model, model_path)
         
-        with open(thresholds_path, 'wb') as f:
-            pickle.dump(self.thresholds, f)
+        save_pickle(self.thresholds, thresholds_path)
         
         print(f"Anomaly detection model saved to {model_path}")
     
@@ -137,16 +143,24 @@ class AnomalyDetector:
         thresholds_path = os.path.join(self.model_dir, 'anomaly_detector_thresholds.pkl')
         
         try:
-            with open(thresholds_path, 'rb') as f:
-                self.thresholds = pickle.load(f)
-            
-            try:
-                with open(model_path, 'rb') as f:
-                    self.model = pickle.load(f)
-            except:
-                self.model = None
-            
+            with MODEL_LOAD_LOCK:
+                with open(thresholds_path, 'rb') as f:
+                    thresholds = pickle.load(f)
+                
+                try:
+                    with open(model_path, 'rb') as f:
+                        model = pickle.load(f)
+                except:
+                    model = None
+                
+                # Thresholds mark the detector as loaded, so set them last
+                self.model = model
+                self.thresholds = thresholds
             return True
         except FileNotFoundError:
             print(f"Anomaly detection model files not found at {thresholds_path}")
+            return False
+        except PICKLE_LOAD_ERRORS as e:
+            # The models already loaded (if any) are kept
+            print(f"Error loading anomaly detection model from {thresholds_path}: {str(e)}")
             return False
\ No newline at end of file
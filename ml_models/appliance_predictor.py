@@ -5,6 +5,8 @@ import os
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 
+from ml_models import MODEL_LOAD_LOCK, PICKLE_LOAD_ERRORS, save_pickle
+
 class AppliancePredictor:
     def __init__(self, model_dir='models'):
         """Initialize the appliance usage predictor"""
@@ -168,11 +170,9 @@ class AppliancePredictor:
         model_path = os.path.join(self.model_dir, 'appliance_predictor_model.pkl')
         scaler_path = os.path.join(self.model_dir, 'appliance_predictor_scaler.pkl')
         
-        with open(model_path, 'wb') as f:
-            pickle.dump(self.model, f)
+        save_pickle(self.model, model_path)
         
-        with open(scaler_path, 'wb') as f:
-            pickle.dump(self.scaler, f)
+        save_pickle(self.scaler, scaler_path)
         
         print(f"Appliance prediction model saved to {model_path}")
     
@@ -182,13 +182,20 @@ class AppliancePredictor:
         scaler_path = os.path.join(self.model_dir, 'appliance_predictor_scaler.pkl')
         
         try:
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
-            
+            with MODEL_LOAD_LOCK:
+                with open(model_path, 'rb') as f:
+                    model = pickle.load(f)
+                
+                with open(scaler_path, 'rb') as f:
+                    scaler = pickle.load(f)
+                
+                self.scaler = scaler
+                self.model = model
             return True
         except FileNotFoundError:
             print(f"Appliance prediction model files not found at {model_path}")
+            return False
+        except PICKLE_LOAD_ERRORS as e:
+            # The models already loaded (if any) are kept
+            print(f"Error loading appliance prediction model from {model_path}: {str(e)}")
             return False
\ No newline at end of file
@@ -4,6 +4,8 @@ from sklearn.ensemble import GradientBoostingRegressor
 import pickle
 import os
 
+from ml_models import MODEL_LOAD_LOCK, PICKLE_LOAD_ERRORS, save_pickle
+
 class CombinedPredictor:
     """Predictor that combines bill data with appliance usage data"""
     
@@ -153,11 +155,9 @@ class CombinedPredictor:
         model_path = os.path.join(self.model_dir, 'combined_predictor_model.pkl')
         scaler_path = os.path.join(self.model_dir, 'combined_predictor_scaler.pkl')
         
-        with open(model_path, 'wb') as f:
-            pickle.dump(self.model, f)
+        save_pickle(self.model, model_path)
         
-        with open(scaler_path, 'wb') as f:
-            pickle.dump(self.scaler, f)
+        save_pickle(self.scaler, scaler_path)
         
         print(f"Combined prediction model saved to {model_path}")
     
@@ -167,13 +167,20 @@ class CombinedPredictor:
         scaler_path = os.path.join(self.model_dir, 'combined_predictor_scaler.pkl')
         
         try:
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
-            
+            with MODEL_LOAD_LOCK:
+                with open(model_path, 'rb') as f:
+                    model = pickle.load(f)
+                
+                with open(scaler_path, 'rb') as f:
+                    scaler = pickle.load(f)
+                
+                self.scaler = scaler
+                self.model = model
             return True
         except FileNotFoundError:
             print(f"Combined prediction model files not found at {model_path}")
+            return False
+        except PICKLE_LOAD_ERRORS as e:
+            # The models already loaded (if any) are kept
+            print(f"Error loading combined prediction model from {model_path}: {str(e)}")
             return False
\ No newline at end of file
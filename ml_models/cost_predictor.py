@@ -3,6 +3,8 @@ import pandas as pd
 import pickle
 import os
 
+from ml_models import MODEL_LOAD_LOCK, PICKLE_LOAD_ERRORS, save_pickle
+
 class CostPredictor:
     def __init__(self, model_dir='models'):
         """Initialize the cost predictor model"""
@@ -92,8 +94,7 @@ class CostPredictor:
         """Save the trained ratios and rates"""
         model_path = os.path.join(self.model_dir, 'cost_predictor_data.pkl')
         
-        with open(model_path, 'wb') as f:
-            pickle.dump({'rates': self.rates, 'charge_ratios': self.charge_ratios}, f)
+        save_pickle({'rates': self.rates, 'charge_ratios': self.charge_ratios}, model_path)
         
         print(f"Cost model saved to {model_path}")
     
@@ -102,12 +103,17 @@ class CostPredictor:
         model_path = os.path.join(self.model_dir, 'cost_predictor_data.pkl')
         
         try:
-            with open(model_path, 'rb') as f:
+            with MODEL_LOAD_LOCK, open(model_path, 'rb') as f:
                 data = pickle.load(f)
-                self.rates = data.get('rates', {})
+                # Rates mark the predictor as loaded, so set them last
                 self.charge_ratios = data.get('charge_ratios', {})
+                self.rates = data.get('rates', {})
             
             return True
         except FileNotFoundError:
             print(f"Cost model file not found at {model_path}")
+            return False
+        except PICKLE_LOAD_ERRORS as e:
+            # The models already loaded (if any) are kept
+            print(f"Error loading cost model from {model_path}: {str(e)}")
             return False
\ No newline at end of file
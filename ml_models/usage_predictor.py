@@ -1,12 +1,16 @@
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
-from xgboost import XGBRegressor
-from sklearn.neighbors import KNeighborsRegressor
 import pickle
 import os
+import sys
 from datetime import datetime, timedelta
 
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import time_stage
+from ml_models import MODEL_LOAD_LOCK, PICKLE_LOAD_ERRORS, save_pickle
+
 class UsagePredictor:
     def __init__(self, model_dir='models'):
         """Initialize the usage predictor model"""
@@ -41,7 +45,8 @@ class UsagePredictor:
         # Apply log transformation to target for better handling of high variance
         y = np.log1p(features['target_kwh'])
         
-        # Scale features
+        # Scale features (sklearn is imported here so serving doesn't pay for it up front)
+        from sklearn.preprocessing import StandardScaler
         self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
         
@@ -55,6 +60,7 @@ class UsagePredictor:
     
         return True
     
+    @time_stage('usage_inference')
     def predict(self, data, future_months=3):
         """
         Predict usage for future months with improved features
@@ -135,7 +141,96 @@ class UsagePredictor:
             })
         
         return pd.DataFrame(predictions)
-    
+
+    @time_stage('usage_inference')
+    def predict_many(self, histories, future_months=3):
+        """
+        Predict usage for many accounts with a single model call
+
+        Builds the same features as predict() for every account and future
+        month at once, then scales and predicts the stacked feature matrix.
+
+        Args:
+            histories: Dictionary of account number -> DataFrame of that
+                account's historical bill data
+            future_months: Number of months to predict
+
+        Returns:
+            Dictionary of account number -> DataFrame with predictions (in
+            the format of predict()), or None if no model is available
+        """
+        if self.model is None:
+            self._load_model()
+            if self.model is None:
+                print("No trained model found. Please train the model first.")
+                return None
+
+        histories = {account: df for account, df in histories.items() if df is not None and not df.empty}
+        if not histories:
+            return {}
+
+        # Stack every account's history, sorted by date within each account
+        data = pd.concat([self._prepare_data(df).assign(account=account) for account, df in histories.items()],
+                         ignore_index=True)
+        data = data.sort_values(['account', 'bill_date'], kind='stable')
+        by_account = data.groupby('account', sort=False)
+
+        # Recent usage: the last three bills of each account
+        recent = by_account.tail(3).copy()
+        recent['lag'] = recent.groupby('account', sort=False).cumcount(ascending=False)
+        lags = recent.pivot(index='account', columns='lag', values='kwh_used').reindex(columns=[0, 1, 2])
+        avg_3m_kwh = recent.groupby('account', sort=False)['kwh_used'].mean()
+
+        # Average temperature per account and calendar month
+        month_temps = data.groupby(['account', 'month'])['avg_daily_temperature'].mean()
+
+        # One row per account and prediction month
+        accounts = list(histories)
+        steps = np.arange(1, future_months + 1)
+        rows = pd.DataFrame({
+            'account': np.repeat(accounts, future_months),
+            'step': np.tile(steps, len(accounts))
+        })
+        last_dates = by_account['bill_date'].max().reindex(rows['account']).to_numpy()
+        rows['prediction_date'] = last_dates + pd.to_timedelta(rows['step'] * 30, unit='D').to_numpy()
+        month = rows['prediction_date'].dt.month.astype('int64')
+
+        default_temps = month.map(self._default_temp_for_month)
+        temp_index = pd.MultiIndex.from_arrays([rows['account'], month])
+        avg_temp = month_temps.reindex(temp_index).to_numpy()
+        has_month = temp_index.isin(month_temps.index)
+        avg_temp = np.where(has_month, avg_temp, default_temps.to_numpy())
+
+        account_lags = lags.reindex(rows['account'])
+        features_df = pd.DataFrame({
+            'month': month.to_numpy(),
+            'month_sin': np.sin(2 * np.pi * month.to_numpy() / 12),
+            'month_cos': np.cos(2 * np.pi * month.to_numpy() / 12),
+            'avg_daily_temperature': avg_temp,
+            'days_in_billing_period': 30,  # Standard assumption
+            'avg_temp_x_month': avg_temp * month.to_numpy(),
+            'days_x_temp': 30 * avg_temp,
+            'avg_3m_kwh': avg_3m_kwh.reindex(rows['account']).to_numpy(),
+            'last_month_kwh': account_lags[0].to_numpy(),
+            'last_2_month_kwh': account_lags[1].fillna(0).to_numpy(),
+            'last_3_month_kwh': account_lags[2].fillna(0).to_numpy()
+        })
+
+        # Scale and predict every row at once (with log transform reversal)
+        features_scaled = self.scaler.transform(features_df)
+        kwh_predictions = np.expm1(self.model.predict(features_scaled))
+
+        rows['month'] = month.to_numpy()
+        rows['predicted_kwh'] = np.round(kwh_predictions).astype(int)
+        rows['lower_bound'] = np.round(kwh_predictions * 0.85).astype(int)  # 15% lower
+        rows['upper_bound'] = np.round(kwh_predictions * 1.15).astype(int)  # 15% higher
+        rows['avg_daily_temperature'] = avg_temp
+        rows['prediction_date'] = rows['prediction_date'].dt.strftime('%Y-%m-%d')
+
+        columns = ['prediction_date', 'month', 'predicted_kwh', 'lower_bound', 'upper_bound', 'avg_daily_temperature']
+        return {account: group[columns].reset_index(drop=True)
+                for account, group in rows.groupby('account', sort=False)}
+
     def _prepare_data(self, data):
         """Prepare data for training/prediction"""
         df = data.copy()
@@ -198,11 +293,9 @@ class UsagePredictor:
         model_path = os.path.join(self.model_dir, 'usage_predictor_model.pkl')
         scaler_path = os.path.join(self.model_dir, 'usage_predictor_scaler.pkl')
         
-        with open(model_path, 'wb') as f:
-            pickle.dump(self.model, f)
+        save_pickle(self.model, model_path)
         
-        with open(scaler_path, 'wb') as f:
-            pickle.dump(self.scaler, f)
+        save_pickle(self.scaler, scaler_path)
         
         print(f"Model saved to {model_path}")
     
@@ -212,16 +305,24 @@ class UsagePredictor:
         scaler_path = os.path.join(self.model_dir, 'usage_predictor_scaler.pkl')
         
         try:
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
-            
+            with MODEL_LOAD_LOCK:
+                with open(model_path, 'rb') as f:
+                    model = pickle.load(f)
+                
+                with open(scaler_path, 'rb') as f:
+                    scaler = pickle.load(f)
+                
+                # Scaler first: callers check the model, so they never see it without its scaler
+                self.scaler = scaler
+                self.model = model
             return True
         except FileNotFoundError:
             print(f"Model files not found at {model_path}")
             return False
+        except PICKLE_LOAD_ERRORS as e:
+            # The models already loaded (if any) are kept
+            print(f"Error loading usage model from {model_path}: {str(e)}")
+            return False
     def _engineer_enhanced_features(self, df, month_lookahead=1):
         """Create enhanced features for training with cyclical encoding and interactions"""
         # Need at least 4 months of data plus the target month
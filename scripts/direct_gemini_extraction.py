@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import fitz  
 import google.generativeai as genai
@@ -6,42 +7,28 @@ from PIL import Image
 import re
 import uuid
 import time
+import hashlib
 
 from dotenv import load_dotenv
 
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import time_stage
+
 load_dotenv()
 
-def extract_bill_data(pdf_path, api_key):
-    """Extract comprehensive data from a bill PDF using Gemini API"""
-    temp_image = None
-    doc = None
-    
-    try:
-        # Set up Gemini
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        # Create unique filename to avoid conflicts
-        unique_id = str(uuid.uuid4())[:8]
-        temp_image = f"temp_bill_{unique_id}.png"
-        
-        print(f"Processing {os.path.basename(pdf_path)} with temp file {temp_image}")
-        
-        # Render PDF to image
-        doc = fitz.open(pdf_path)
-        page = doc[0]
-        zoom = 2.0  # Higher resolution
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-        
-        # Save as temporary PNG
-        pix.save(temp_image)
-        print(f"Saved temporary image: {temp_image}")
-        
-        # Open with PIL to ensure it's valid
-        with Image.open(temp_image) as img:
-            # Prepare prompt for extraction - requesting all fields needed for the SQL schema
-            prompt = """
+# Gemini model used for extraction
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# Scale the PDF page is rendered at before it is sent to Gemini
+RENDER_ZOOM = 2.0
+
+# Extractions are cached here by PDF content, prompt, model and render scale
+EXTRACTION_CACHE_DIR = 'data/cache/extractions'
+
+# Prompt for extraction - requesting all fields needed for the SQL schema
+BILL_EXTRACTION_PROMPT = """
                 Extract these details from this electricity bill as JSON:
                 - account_number: Account number
                 - customer_name: Customer name
@@ -69,10 +56,121 @@ def extract_bill_data(pdf_path, api_key):
                         
             Return ONLY valid JSON with these fields.
             """
+
+# Prompt specifically for historical usage
+HISTORY_EXTRACTION_PROMPT = """
+            Extract the historical usage data from this electricity bill. 
+            Look for the 'Usage History' section that contains monthly usage data.
+            
+            Return only a JSON array of objects, with each object containing:
+            - month: The month (e.g., "Dec 23", "Jan 24", etc.)
+            - kwh: The kilowatt-hour usage for that month (as a number)
+            
+            Example format:
+            [
+              {"month": "Dec 23", "kwh": 1502},
+              {"month": "Jan 24", "kwh": 1807}
+            ]
+            """
+
+def extraction_cache_key(pdf_path, prompt, pdf_sha256=None):
+    """
+    Cache key for extracting a PDF with a prompt
+    
+    Args:
+        pdf_path: Path to the PDF file
+        prompt: Prompt the PDF is extracted with
+        pdf_sha256: SHA-256 hex digest of the PDF if the caller already has
+            it (e.g. from save_upload); otherwise the file is hashed
+        
+    Returns:
+        SHA-256 hex digest of the PDF bytes, prompt, model and render scale
+    """
+    if pdf_sha256 is None:
+        pdf_digest = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                pdf_digest.update(chunk)
+        pdf_sha256 = pdf_digest.hexdigest()
+    
+    raw = json.dumps([pdf_sha256, prompt, GEMINI_MODEL, RENDER_ZOOM])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _cache_path(cache_key):
+    """Path of a cached extraction (spread over subdirectories by key prefix)"""
+    return os.path.join(EXTRACTION_CACHE_DIR, cache_key[:2], f"{cache_key}.json")
+
+def load_cached_extraction(cache_key):
+    """Get a cached extraction, or None if there isn't one"""
+    try:
+        with open(_cache_path(cache_key), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_cached_extraction(cache_key, data):
+    """Cache an extraction (written atomically, so readers never see part of it)"""
+    cache_path = _cache_path(cache_key)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, cache_path)
+
+def save_processed_output(pdf_path, data, suffix=''):
+    """Save extracted data to data/processed, named after the PDF"""
+    output_dir = 'data/processed'
+    os.makedirs(output_dir, exist_ok=True)
+    output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(pdf_path))[0]}{suffix}.json")
+    
+    with open(output_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    return output_file
+
+def extract_bill_data(pdf_path, api_key, pdf_sha256=None):
+    """Extract comprehensive data from a bill PDF using Gemini API (pdf_sha256: the PDF's digest, if known)"""
+    temp_image = None
+    doc = None
+    
+    try:
+        # Reuse an earlier extraction of the same file with the same prompt and model
+        cache_key = extraction_cache_key(pdf_path, BILL_EXTRACTION_PROMPT, pdf_sha256)
+        data = load_cached_extraction(cache_key)
+        if data is not None:
+            output_file = save_processed_output(pdf_path, data)
+            print(f"Using cached extraction for {os.path.basename(pdf_path)}, saved to {output_file}")
+            return data
+        
+        # Set up Gemini
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(GEMINI_MODEL)
+        
+        # Create unique filename to avoid conflicts
+        unique_id = str(uuid.uuid4())[:8]
+        temp_image = f"temp_bill_{unique_id}.png"
+        
+        print(f"Processing {os.path.basename(pdf_path)} with temp file {temp_image}")
+        
+        # Render PDF to image
+        with time_stage('pdf_render'):
+            doc = fitz.open(pdf_path)
+            page = doc[0]
+            zoom = RENDER_ZOOM  # Higher resolution
+            mat = fitz.Matrix(zoom, zoom)
+            pix = page.get_pixmap(matrix=mat)
+            
+            # Save as temporary PNG
+            pix.save(temp_image)
+        print(f"Saved temporary image: {temp_image}")
+        
+        # Open with PIL to ensure it's valid
+        with Image.open(temp_image) as img:
+            prompt = BILL_EXTRACTION_PROMPT
             
             # Send to Gemini
             print(f"Sending image to Gemini API")
-            response = model.generate_content([prompt, img])
+            with time_stage('gemini_extraction'):
+                response = model.generate_content([prompt, img])
         
         # Make sure to close the document
         if doc:
@@ -93,12 +191,8 @@ def extract_bill_data(pdf_path, api_key):
                 data = json.loads(json_str)
                 
                 # Save to JSON file
-                output_dir = 'data/processed'
-                os.makedirs(output_dir, exist_ok=True)
-                output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(pdf_path))[0]}.json")
-                
-                with open(output_file, 'w') as f:
-                    json.dump(data, f, indent=2)
+                output_file = save_processed_output(pdf_path, data)
+                save_cached_extraction(cache_key, data)
                 
                 print(f"Successfully extracted data and saved to {output_file}")
                 return data
@@ -149,8 +243,16 @@ def extract_historical_usage(pdf_path, api_key):
     doc = None
     
     try:
+        # Reuse an earlier extraction of the same file with the same prompt and model
+        cache_key = extraction_cache_key(pdf_path, HISTORY_EXTRACTION_PROMPT)
+        data = load_cached_extraction(cache_key)
+        if data is not None:
+            output_file = save_processed_output(pdf_path, data, suffix='_history')
+            print(f"Using cached historical data for {os.path.basename(pdf_path)}, saved to {output_file}")
+            return data
+        
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        model = genai.GenerativeModel(GEMINI_MODEL)
         
         # Create unique filename to avoid conflicts
         unique_id = str(uuid.uuid4())[:8]
@@ -159,7 +261,7 @@ def extract_historical_usage(pdf_path, api_key):
         # Render PDF to image
         doc = fitz.open(pdf_path)
         page = doc[0]
-        zoom = 2.0
+        zoom = RENDER_ZOOM
         mat = fitz.Matrix(zoom, zoom)
         pix = page.get_pixmap(matrix=mat)
         
@@ -168,21 +270,7 @@ def extract_historical_usage(pdf_path, api_key):
         
         # Open with PIL to ensure it's valid
         with Image.open(temp_image) as img:
-            # Prompt specifically for historical usage
-            prompt = """
-            Extract the historical usage data from this electricity bill. 
-            Look for the 'Usage History' section that contains monthly usage data.
-            
-            Return only a JSON array of objects, with each object containing:
-            - month: The month (e.g., "Dec 23", "Jan 24", etc.)
-            - kwh: The kilowatt-hour usage for that month (as a number)
-            
-            Example format:
-            [
-              {"month": "Dec 23", "kwh": 1502},
-              {"month": "Jan 24", "kwh": 1807}
-            ]
-            """
+            prompt = HISTORY_EXTRACTION_PROMPT
             
             response = model.generate_content([prompt, img])
         
@@ -202,12 +290,8 @@ def extract_historical_usage(pdf_path, api_key):
                 data = json.loads(json_str)
                 
                 # Save historical data
-                output_dir = 'data/processed'
-                os.makedirs(output_dir, exist_ok=True)
-                output_file = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(pdf_path))[0]}_history.json")
-                
-                with open(output_file, 'w') as f:
-                    json.dump(data, f, indent=2)
+                output_file = save_processed_output(pdf_path, data, suffix='_history')
+                save_cached_extraction(cache_key, data)
                 
                 print(f"Successfully extracted historical data and saved to {output_file}")
                 return data
@@ -12,24 +12,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ml_models.usage_predictor import UsagePredictor
 from ml_models.cost_predictor import CostPredictor
+from database.columnar import load_bill_frame
 
 def load_data():
     """Load the combined bill data"""
     try:
-        data_path = 'data/processed/combined_bills.json'
-        
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        
-        df = pd.DataFrame(data)
-        
-        # Convert date columns
-        date_columns = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col])
-        
-        return df
+        # Typed columnar snapshot of the bill store (dates already datetime64)
+        return load_bill_frame()
     except Exception as e:
         print(f"Error loading data: {e}")
         return None
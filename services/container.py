@@ -0,0 +1,223 @@
+import os
+import sys
+import time
+import pickle
+import asyncio
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Request
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from database.repository import FileLock, get_bill_repository
+from services.history_provider import get_history_provider
+from services.prediction_service import get_prediction_service
+from services.job_manager import JobManager
+from services.result_cache import ResultCache, model_files_version
+from ml_models import MODEL_LOAD_LOCK
+from utils.data_manager import retrain_models_with_history
+from utils.metrics import time_stage
+
+
+def load_ml_models(models_dir='models'):
+    """
+    Load the pre-trained bill, appliance and combined prediction models
+
+    Returns:
+        Dictionary of models and scalers (empty if none could be loaded)
+    """
+    models = {}
+    try:
+        with MODEL_LOAD_LOCK:
+            # Bill prediction model
+            if os.path.exists(f'{models_dir}/bill_predictor_model.pkl'):
+                with open(f'{models_dir}/bill_predictor_model.pkl', 'rb') as f:
+                    models['bill_model'] = pickle.load(f)
+                with open(f'{models_dir}/bill_predictor_scaler.pkl', 'rb') as f:
+                    models['bill_scaler'] = pickle.load(f)
+
+            # Appliance prediction model
+            if os.path.exists(f'{models_dir}/appliance_predictor_model.pkl'):
+                with open(f'{models_dir}/appliance_predictor_model.pkl', 'rb') as f:
+                    models['appliance_model'] = pickle.load(f)
+                with open(f'{models_dir}/appliance_predictor_scaler.pkl', 'rb') as f:
+                    models['appliance_scaler'] = pickle.load(f)
+
+            # Combined prediction model
+            if os.path.exists(f'{models_dir}/combined_predictor_model.pkl'):
+                with open(f'{models_dir}/combined_predictor_model.pkl', 'rb') as f:
+                    models['combined_model'] = pickle.load(f)
+                with open(f'{models_dir}/combined_predictor_scaler.pkl', 'rb') as f:
+                    models['combined_scaler'] = pickle.load(f)
+
+        print(f"Loaded {len(models)//2} ML models successfully")
+        return models
+    except Exception as e:
+        print(f"Error loading ML models: {str(e)}")
+        return {}
+
+
+class ServiceContainer:
+    def __init__(self, models_dir='models'):
+        """
+        Initialize the service container
+
+        Holds the services and models shared by every request in a worker.
+        The app creates one in its lifespan handler and stores it on
+        app.state; endpoints get it through Depends(get_services). Models
+        are loaded on first use (or ahead of time by warm_up), so workers
+        start serving without waiting for every pickle. The prediction
+        service is also created on first use, since the predictor modules
+        import pandas (and with it pyarrow). Every model load holds
+        MODEL_LOAD_LOCK, so a warm-up running alongside the first requests
+        can't race them.
+
+        Args:
+            models_dir: Directory with the pickled models
+        """
+        self.models_dir = models_dir
+        self.bill_repository = None
+        self.history_provider = None
+        self.job_manager = None
+        self.executor = None
+        self.result_cache = ResultCache()
+        self.model_version = None
+        self._ml_models = None
+        self._prediction_service = None
+        self._retrain_lock = threading.Lock()
+        # Retraining writes the model files under an exclusive lock and
+        # reloads read them under a shared one, so no worker loads a new
+        # model with an old scaler. Two handles, since each FileLock is
+        # only re-entrant for its own holder.
+        self._model_write_lock = FileLock(f"{os.path.normpath(models_dir)}.lock")
+        self._model_read_lock = FileLock(f"{os.path.normpath(models_dir)}.lock")
+
+    def load(self):
+        """Open the bill store and create the shared services (models load lazily)"""
+        self.bill_repository = get_bill_repository()
+        self.history_provider = get_history_provider()
+        self.model_version = model_files_version(self.models_dir)
+        self.job_manager = JobManager()
+        self.executor = ThreadPoolExecutor(max_workers=config.BLOCKING_WORKERS,
+                                           thread_name_prefix='blocking')
+        return self
+
+    @property
+    def prediction_service(self):
+        """The usage and cost prediction service, created on first use"""
+        if self._prediction_service is None:
+            self._prediction_service = get_prediction_service()
+        return self._prediction_service
+
+    @property
+    def anomaly_detector(self):
+        """The prediction service's detector, so its model is only unpickled once"""
+        return self.prediction_service.anomaly_detector
+
+    @property
+    def ml_models(self):
+        """The bill, appliance and combined models, loaded on first use"""
+        models = self._ml_models
+        if models is None:
+            with MODEL_LOAD_LOCK, self._model_read_lock.hold(exclusive=False):
+                models = self._ml_models
+                if models is None:
+                    models = load_ml_models(self.models_dir)
+                    # A failed load is retried by the next request instead of cached
+                    if models:
+                        self._ml_models = models
+        return models
+
+    def warm_up(self):
+        """Load every model ahead of the first request that needs it"""
+        started = time.perf_counter()
+        prediction_service = self.prediction_service
+        with MODEL_LOAD_LOCK, self._model_read_lock.hold(exclusive=False):
+            self.ml_models
+            if prediction_service.usage_predictor.model is None:
+                prediction_service.usage_predictor._load_model()
+            if not prediction_service.cost_predictor.rates:
+                prediction_service.cost_predictor._load_model()
+            if not self.anomaly_detector.thresholds:
+                self.anomaly_detector._load_model()
+        print(f"Model warm-up finished in {time.perf_counter() - started:.2f}s")
+
+    def reload_models(self):
+        """
+        Re-read the model files, e.g. after retraining
+
+        A model that fails to load (say, an unreadable file) keeps the
+        version already loaded, so requests go on being served.
+        """
+        with MODEL_LOAD_LOCK, self._model_read_lock.hold(exclusive=False):
+            # Read under the lock, so it matches the files loaded
+            version = model_files_version(self.models_dir)
+            self.prediction_service.usage_predictor._load_model()
+            self.prediction_service.cost_predictor._load_model()
+            self.anomaly_detector._load_model()
+            # Still unset after a failed first load, so the next request tries again
+            self._ml_models = load_ml_models(self.models_dir) or self._ml_models
+            # Cached results are keyed on the model version, so the old ones
+            # can never be served again
+            self.model_version = version
+        self.result_cache.clear()
+
+    def current_model_version(self):
+        """
+        Version of the model files on disk, reloading the models first if
+        they have changed (e.g. another worker retrained them)
+
+        Returns:
+            The model version (see model_files_version)
+        """
+        version = model_files_version(self.models_dir)
+        if version != self.model_version:
+            with MODEL_LOAD_LOCK:
+                if model_files_version(self.models_dir) != self.model_version:
+                    self.reload_models()
+            version = self.model_version
+        return version
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """
+        Run blocking work (model inference, Gemini calls, file I/O) in the
+        bounded thread pool so it doesn't hold up the event loop
+
+        Returns:
+            Whatever func returns
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def retrain(self):
+        """
+        Retrain the models on the stored history and load the new ones
+
+        Returns:
+            True if the models were retrained
+        """
+        # One retrain at a time, however many uploads ask for it
+        with self._retrain_lock, time_stage('retrain'):
+            with self._model_write_lock.hold(exclusive=True):
+                success = retrain_models_with_history()
+            if success:
+                self.reload_models()
+            return success
+
+    def close(self):
+        """Wait for background jobs and flush pending bill store writes"""
+        if self.job_manager is not None:
+            self.job_manager.shutdown()
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.bill_repository is not None:
+            self.bill_repository.flush()
+
+
+def get_services(request: Request):
+    """FastAPI dependency returning the app's service container"""
+    return request.app.state.services
@@ -1,12 +1,30 @@
 # services/gemini_recommendation_service.py
-import google.generativeai as genai
+import os
+import sys
 import json
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import time_stage
 
 class GeminiRecommendationService:
     def __init__(self, api_key):
         self.api_key = api_key
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
+        self._model = None
+        self._lock = threading.Lock()
+    
+    @property
+    def model(self):
+        """Gemini model, configured on first use (importing the client is slow)"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel("gemini-1.5-flash")
+        return self._model
     
     def generate_insights(self, bill_data, predictions, anomalies):
         """Generate AI insights based on bill data, predictions, and anomalies"""
@@ -34,7 +52,8 @@ class GeminiRecommendationService:
             """
 
             # Get AI-generated recommendations
-            response = self.model.generate_content(prompt)
+            with time_stage('gemini_recommendations'):
+                response = self.model.generate_content(prompt)
             
             # Parse the response to extract JSON recommendations
             text = response.text
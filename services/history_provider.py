@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from database.repository import get_bill_repository
+from utils.metrics import time_stage
+
+
+class HistoryProvider:
+    def __init__(self, repository=None, max_bytes=None):
+        """
+        Initialize the history provider
+
+        Per-account history frames are loaded on first request and kept in
+        an LRU cache bounded by their memory footprint, so only the accounts
+        being predicted for are held in memory however many accounts the
+        bill store has. This is the only copy that is cached. A frame is
+        rebuilt when its account's bills change (see
+        BillRepository.account_version), including bills written by other
+        worker processes; writes to other accounts leave it cached.
+
+        Args:
+            repository: Bill repository to load from (defaults to the shared one)
+            max_bytes: Memory budget for cached frames, defaults to
+                config.HISTORY_CACHE_MAX_BYTES
+        """
+        self.repository = repository
+        self.max_bytes = config.HISTORY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.cached_bytes = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, account_number):
+        """
+        Get an account's bill history
+
+        Args:
+            account_number: Account number to look up
+
+        Returns:
+            Date-sorted DataFrame of the account's time series (shared - do
+            not modify it), or None if the account has no dated bills
+        """
+        repository = self.repository or get_bill_repository()
+        # Checks the store for other workers' writes before comparing
+        version = repository.account_version(account_number)
+
+        with self._lock:
+            entry = self._frames.get(account_number)
+            if entry is not None and entry[0] == version:
+                self._frames.move_to_end(account_number)
+                return entry[1]
+
+        import pandas as pd
+
+        with time_stage('history_load'):
+            series = repository.account_series(account_number)
+            if len(series['bill_date']) == 0:
+                return None
+            frame = pd.DataFrame(series)
+            size = int(frame.memory_usage(index=True, deep=True).sum())
+
+        with self._lock:
+            self._discard(account_number)
+            if size <= self.max_bytes:
+                self._frames[account_number] = (version, frame, size)
+                self.cached_bytes += size
+                # Evict the least recently used accounts until within budget
+                while self.cached_bytes > self.max_bytes:
+                    self._discard(next(iter(self._frames)))
+        return frame
+
+    def clear(self):
+        """Drop all cached frames"""
+        with self._lock:
+            self._frames.clear()
+            self.cached_bytes = 0
+
+    def _discard(self, account_number):
+        """Remove an account's frame from the cache, if present"""
+        entry = self._frames.pop(account_number, None)
+        if entry is not None:
+            self.cached_bytes -= entry[2]
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_history_provider():
+    """Get the shared history provider, creating it on first use"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = HistoryProvider()
+    return _provider
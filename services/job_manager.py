@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class JobError(Exception):
+    """Raised by a job function to fail the job with a user-facing message"""
+    pass
+
+
+def _job_paths(directory, job_id):
+    """Paths of a job's status record and event log in the job store"""
+    base = os.path.join(directory, job_id)
+    return f"{base}.json", f"{base}.events.jsonl"
+
+
+class Job:
+    def __init__(self, kind, directory=None):
+        """
+        Initialize a background job record
+
+        Args:
+            kind: What the job does (e.g. "upload")
+            directory: Job store directory to write the status and events to,
+                so other worker processes can read them (None for memory only)
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.stage = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.events = []
+        self.directory = directory
+        self.save()
+
+    @property
+    def finished(self):
+        """Whether the job has succeeded or failed"""
+        return self.status in (SUCCEEDED, FAILED)
+
+    def set_stage(self, stage):
+        """Record the pipeline stage the job has reached"""
+        self.stage = stage
+        self.updated_at = time.time()
+        self.save()
+        self.add_event('stage', {'stage': stage})
+
+    def add_event(self, event, data=None):
+        """
+        Record a progress event for clients following the job
+
+        Events are only ever appended (to the list and to the job's event
+        log), so readers can follow them by position without locking (see
+        events_since).
+
+        Args:
+            event: Event name (e.g. "stage", "predictions")
+            data: JSON-serializable event payload, such as a partial result
+        """
+        event = {'id': len(self.events), 'event': event, 'data': data}
+        if self.directory:
+            try:
+                line = json.dumps(event, default=str) + '\n'
+                with open(_job_paths(self.directory, self.id)[1], 'a') as f:
+                    f.write(line)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Error writing event for job {self.id}: {str(e)}")
+        self.events.append(event)
+
+    def events_since(self, position):
+        """Events recorded after the first `position` ones"""
+        return self.events[position:]
+
+    def to_dict(self):
+        """Status of the job, with its result once it has succeeded"""
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+    def save(self, status=None):
+        """
+        Write the job's status to the job store (atomically), if it has one
+
+        Args:
+            status: Status to record instead of the current one
+        """
+        if not self.directory:
+            return
+        record = self.to_dict()
+        if status is not None:
+            record['status'] = status
+        status_path = _job_paths(self.directory, self.id)[0]
+        tmp_path = f"{status_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(record, f, default=str)
+            os.replace(tmp_path, status_path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error saving status of job {self.id}: {str(e)}")
+
+
+class StoredJob:
+    def __init__(self, directory, status):
+        """
+        Read-only view of a job from the job store
+
+        Used for jobs that another worker process is running (or ran): the
+        status is read once, the events are re-read on every events_since
+        call so a stream can follow the job.
+
+        Args:
+            directory: Job store directory
+            status: The job's status record (see Job.to_dict)
+        """
+        self.directory = directory
+        self.status_record = status
+        self.id = status['job_id']
+        self.status = status['status']
+
+    @property
+    def finished(self):
+        """Whether the job had succeeded or failed when it was read"""
+        return self.status in (SUCCEEDED, FAILED)
+
+    @classmethod
+    def load(cls, directory, job_id):
+        """
+        Read a job's status from the job store
+
+        Returns:
+            StoredJob, or None if the store has no (readable) job with this ID
+        """
+        try:
+            with open(_job_paths(directory, job_id)[0], 'r') as f:
+                return cls(directory, json.load(f))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def events_since(self, position):
+        """Events logged after the first `position` ones"""
+        try:
+            with open(_job_paths(self.directory, self.id)[1], 'r') as f:
+                lines = f.read().split('\n')
+        except FileNotFoundError:
+            return []
+        # The last piece is empty, or an event still being written
+        return [json.loads(line) for line in lines[position:-1]]
+
+    def to_dict(self):
+        """Status of the job, with its result once it has succeeded"""
+        return dict(self.status_record)
+
+
+class JobManager:
+    def __init__(self, max_workers=None, max_jobs=None, directory=None):
+        """
+        Initialize the job manager
+
+        Runs jobs on a thread pool and keeps their status and results, so
+        endpoints can return a job ID straight away and clients poll
+        GET /api/jobs/{id} or follow its progress events. Each job's status
+        and events are also written to the job store directory, where the
+        other worker processes find the jobs they aren't running. Only the
+        most recent max_jobs finished jobs of this process are kept.
+
+        Args:
+            max_workers: Worker threads, defaults to config.JOB_WORKERS
+            max_jobs: Finished jobs to keep, defaults to config.JOB_HISTORY_SIZE
+            directory: Job store directory, defaults to config.JOB_STORE_DIR
+                ("" keeps jobs in this process's memory only)
+        """
+        self.max_jobs = config.JOB_HISTORY_SIZE if max_jobs is None else max_jobs
+        self.directory = config.JOB_STORE_DIR if directory is None else directory
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or config.JOB_WORKERS,
+                                            thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, **kwargs):
+        """
+        Queue a job
+
+        Args:
+            kind: What the job does (e.g. "upload")
+            func: Called as func(job, *args, **kwargs); its return value
+                becomes the job result. Raise JobError to fail the job with
+                a message.
+
+        Returns:
+            The queued Job
+        """
+        job = Job(kind, self.directory)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """
+        Get a job by ID
+
+        Returns:
+            The Job if this process is running it, a StoredJob if another
+            worker is, or None if it is unknown or has been pruned
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.directory and _is_job_id(job_id):
+            job = StoredJob.load(self.directory, job_id)
+        return job
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _run(self, job, func, args, kwargs):
+        """Run a job and record its outcome"""
+        job.status = RUNNING
+        job.updated_at = time.time()
+        job.save()
+        try:
+            result = func(job, *args, **kwargs)
+            job.result = result
+            job.add_event('succeeded', result)
+            status = SUCCEEDED
+        except JobError as e:
+            job.error = str(e)
+            job.add_event('failed', {'error': job.error})
+            status = FAILED
+        except Exception as e:
+            print(f"Error in {job.kind} job {job.id}: {str(e)}")
+            print(traceback.format_exc())
+            job.error = str(e)
+            job.add_event('failed', {'error': job.error})
+            status = FAILED
+        job.updated_at = time.time()
+        # Stored before it is set here, so a finished job is always on disk
+        job.save(status)
+        job.status = status
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_jobs"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+            if self.directory:
+                for path in _job_paths(self.directory, job_id):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+def _is_job_id(job_id):
+    """Whether a string looks like a job ID (so it is safe as a file name)"""
+    return len(job_id) == 32 and all(c in '0123456789abcdef' for c in job_id)
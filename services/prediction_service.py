@@ -1,26 +1,27 @@
 import os
-import pandas as pd
 import json
+import threading
 from datetime import datetime
 import sys
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from ml_models.usage_predictor import UsagePredictor
-from ml_models.cost_predictor import CostPredictor
-from ml_models.anomaly_detector import AnomalyDetector
+from services.history_provider import get_history_provider
 
 class PredictionService:
     def __init__(self):
         """Initialize the prediction service"""
+        # Imported on first use - the predictor modules pull in pandas
+        from ml_models.usage_predictor import UsagePredictor
+        from ml_models.cost_predictor import CostPredictor
+        from ml_models.anomaly_detector import AnomalyDetector
+        
         self.usage_predictor = UsagePredictor()
         self.cost_predictor = CostPredictor()
         self.anomaly_detector = AnomalyDetector()
         
-        # Load historical data
-        self.historical_data = self._load_historical_data()
-    
+
     def predict_future_bills(self, account_number, months=3):
         """
         Predict future bills for an account
@@ -32,13 +33,10 @@ class PredictionService:
         Returns:
             Dictionary with predictions
         """
-        if self.historical_data is None:
-            return {'error': 'No historical data available'}
-        
-        # Filter data for this account
-        account_data = self.historical_data[self.historical_data['account_number'] == account_number]
+        # Load the account's history (cached across requests)
+        account_data = get_history_provider().get(account_number)
         
-        if account_data.empty:
+        if account_data is None:
             return {'error': f'No data found for account {account_number}'}
         
         # Generate usage predictions
@@ -84,24 +82,17 @@ class PredictionService:
             List of anomalies detected
         """
         return self.anomaly_detector.detect_anomalies(bill_data)
-    
-    def _load_historical_data(self):
-        """Load the historical bill data"""
-        try:
-            data_path = 'data/processed/combined_bills.json'
-            
-            with open(data_path, 'r') as f:
-                data = json.load(f)
-            
-            df = pd.DataFrame(data)
-            
-            # Convert date columns
-            date_columns = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
-            for col in date_columns:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col])
-            
-            return df
-        except Exception as e:
-            print(f"Error loading historical data: {e}")
-            return None
\ No newline at end of file
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_prediction_service():
+    """Get the shared prediction service, creating it on first use"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = PredictionService()
+    return _service
@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+def model_files_version(models_dir='models'):
+    """Hash of the model files' names, sizes and modification times"""
+    digest = hashlib.sha1()
+    try:
+        names = sorted(name for name in os.listdir(models_dir) if name.endswith('.pkl'))
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        stat = os.stat(os.path.join(models_dir, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=None, ttl=None):
+        """
+        Initialize the result cache
+
+        An in-memory LRU cache of endpoint results for deterministic
+        predictions. Keys are hashes of the endpoint inputs and the model
+        version (see make_key), so results are never served for other
+        inputs or from replaced models. Entries expire after ttl seconds.
+
+        Args:
+            max_entries: Most results to keep, defaults to config.RESULT_CACHE_SIZE
+            ttl: Seconds a result stays valid, defaults to config.RESULT_CACHE_TTL
+        """
+        self.max_entries = config.RESULT_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = config.RESULT_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(namespace, inputs, model_version):
+        """
+        Build a cache key
+
+        Args:
+            namespace: Name of the endpoint or computation
+            inputs: JSON-serializable inputs the result depends on
+            model_version: Version of the models that produce the result
+
+        Returns:
+            Hex digest identifying the result
+        """
+        raw = json.dumps([namespace, inputs, model_version], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Get a cached result, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, result):
+        """Cache a result, evicting the least recently used ones beyond max_entries"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached results"""
+        with self._lock:
+            self._entries.clear()
@@ -4,10 +4,24 @@ import BillUploader from './components/BillUploader';
 import ApplianceSimulator from './components/ApplianceSimulator';
 import ResultsDisplay from './components/ResultsDisplay';
 
+const JOB_POLL_INTERVAL_MS = 1000;
+
+// Job events that carry part of the analysis results
+const PARTIAL_RESULT_EVENTS = ['extracted', 'anomalies', 'predictions', 'recommendations'];
+
+const STAGE_MESSAGES = {
+  extracting: 'Reading your bill...',
+  saving: 'Saving your bill...',
+  retraining: 'Updating our models with your bill...',
+  analyzing: 'Checking for anomalies and predicting future bills...',
+  recommending: 'Preparing recommendations...',
+};
+
 function App() {
   const [uploadMode, setUploadMode] = useState('bill-only');
   const [analysisResults, setAnalysisResults] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [loadingStage, setLoadingStage] = useState(null);
   const [error, setError] = useState(null);
 
   const handleModeChange = (mode) => {
@@ -15,8 +29,66 @@ function App() {
     setAnalysisResults(null);
   };
 
+  // Poll a background job until it finishes, returning its result
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`http://localhost:8000/api/jobs/${jobId}`);
+      
+      if (!response.ok) {
+        throw new Error(`Error: ${response.status}`);
+      }
+      
+      const job = await response.json();
+      setLoadingStage(job.stage);
+      
+      if (job.status === 'succeeded') {
+        return job.result;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Bill analysis failed');
+      }
+      
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+  };
+
+  // Follow a background job's events, showing partial results as they
+  // arrive; falls back to polling if the event stream isn't available
+  const followJob = (jobId) => {
+    if (typeof EventSource === 'undefined') {
+      return waitForJob(jobId);
+    }
+    
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(`http://localhost:8000/api/jobs/${jobId}/events`);
+      const showPartial = (event) => {
+        const partial = JSON.parse(event.data);
+        setAnalysisResults((results) => ({ ...results, ...partial }));
+      };
+      
+      source.addEventListener('stage', (event) => {
+        setLoadingStage(JSON.parse(event.data).stage);
+      });
+      PARTIAL_RESULT_EVENTS.forEach((name) => source.addEventListener(name, showPartial));
+      source.addEventListener('succeeded', (event) => {
+        source.close();
+        resolve(JSON.parse(event.data));
+      });
+      source.addEventListener('failed', (event) => {
+        source.close();
+        reject(new Error(JSON.parse(event.data).error || 'Bill analysis failed'));
+      });
+      source.onerror = () => {
+        source.close();
+        waitForJob(jobId).then(resolve, reject);
+      };
+    });
+  };
+
   const handleBillUpload = async (formData) => {
     setLoading(true);
+    setLoadingStage(null);
+    setAnalysisResults(null);
     setError(null);
     
     try {
@@ -29,8 +101,10 @@ function App() {
         throw new Error(`Error: ${response.status}`);
       }
       
-      const data = await response.json();
-      setAnalysisResults(data);
+      // The upload is analyzed in the background
+      const { job_id } = await response.json();
+      const data = await followJob(job_id);
+      setAnalysisResults((results) => ({ ...results, ...data }));
     } catch (err) {
       setError(err.message);
       console.error(err);
@@ -41,6 +115,8 @@ function App() {
 
   const handleCombinedUpload = async (formData) => {
     setLoading(true);
+    setLoadingStage(null);
+    setAnalysisResults(null);
     setError(null);
     
     try {
@@ -108,7 +184,9 @@ function App() {
         {loading && (
           <div className="text-center py-10">
             <div className="animate-spin rounded-full h-12 w-12 border-b-2 border-blue-700 mx-auto"></div>
-            <p className="mt-4 text-gray-600">Analyzing your electricity bill...</p>
+            <p className="mt-4 text-gray-600">
+              {STAGE_MESSAGES[loadingStage] || 'Analyzing your electricity bill...'}
+            </p>
           </div>
         )}
         
@@ -120,8 +198,8 @@ function App() {
           </div>
         )}
         
-        {/* Results Display */}
-        {analysisResults && !loading && (
+        {/* Results Display (partial results show while the rest load) */}
+        {analysisResults && (
           <ResultsDisplay results={analysisResults} mode={uploadMode} />
         )}
       </div>
@@ -9,19 +9,23 @@ function ResultsDisplay({ results, mode }) {
       <h2 className="text-2xl font-bold text-center text-blue-600">Analysis Results</h2>
       
       {/* User Info */}
-      <BillSummary 
-        userInfo={results.user_info} 
-        currentBill={results.current_bill || {
-          kwh_used: results.bill_data?.kwh_used,
-          total_bill_amount: results.bill_data?.total_bill_amount
-        }}
-      />
+      {results.user_info && (
+        <BillSummary 
+          userInfo={results.user_info} 
+          currentBill={results.current_bill || {
+            kwh_used: results.bill_data?.kwh_used,
+            total_bill_amount: results.bill_data?.total_bill_amount
+          }}
+        />
+      )}
       
-      {/* Predictions */}
-      <div className="bg-white rounded-lg shadow-md p-6">
-        <h3 className="text-xl font-semibold mb-4">Future Bill Predictions</h3>
-        <PredictionChart predictions={results.predictions} />
-      </div>
+      {/* Predictions (missing while partial results are still arriving) */}
+      {results.predictions && (
+        <div className="bg-white rounded-lg shadow-md p-6">
+          <h3 className="text-xl font-semibold mb-4">Future Bill Predictions</h3>
+          <PredictionChart predictions={results.predictions} />
+        </div>
+      )}
       
       {/* Display Appliance Breakdown if available */}
       {mode === 'combined' && results.prediction && (
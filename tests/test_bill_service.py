@@ -0,0 +1,468 @@
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from datetime import date
+
+import pytest
+
+from database.repository import BillRepository, SQLBillRepository, import_history_file
+
+
+def make_bill(i, account_number=None, bill_date=None):
+    """A minimal bill; i makes the dedup key (account, date, kWh) unique"""
+    return {
+        'account_number': account_number or f"ACCT{i % 5}",
+        'bill_date': bill_date or f"20{10 + i % 14}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        'kwh_used': 500 + i,
+        'total_bill_amount': 90.0,
+    }
+
+
+@pytest.fixture
+def store_paths(tmp_path):
+    return str(tmp_path / 'bills.json'), str(tmp_path / 'bills.log.jsonl')
+
+
+def open_store(store_paths, **kwargs):
+    data_path, log_path = store_paths
+    return BillRepository(data_path, log_path, **kwargs)
+
+
+
+
+def write_bills(store_paths, start, count):
+    """Add bills one call at a time from a separate process"""
+    repository = open_store(store_paths, compact_every=40)
+    for i in range(start, start + count):
+        repository.add_bill(make_bill(i))
+    repository.close()
+
+def test_ids_are_stable_across_compaction_and_reload(store_paths):
+    repository = open_store(store_paths)
+    ids = repository.add_bills([make_bill(i) for i in range(10)])
+    assert ids == list(range(1, 11))
+    before = {bill['id']: bill['kwh_used'] for bill in repository.all_bills()}
+
+    repository.compact()
+    repository.add_bills([make_bill(i) for i in range(10, 15)])
+    repository.close()
+
+    reopened = open_store(store_paths)
+    after = {bill['id']: bill['kwh_used'] for bill in reopened.all_bills()}
+    assert {bill_id: after[bill_id] for bill_id in before} == before
+    assert sorted(after) == list(range(1, 16))
+    assert reopened.get_bill(3)['kwh_used'] == 502
+
+    reopened.reload()
+    assert {bill['id']: bill['kwh_used'] for bill in reopened.all_bills()} == after
+
+def test_snapshot_and_log_are_replayed_on_open(store_paths):
+    data_path, log_path = store_paths
+    repository = open_store(store_paths, compact_every=4)
+    repository.add_bills([make_bill(i) for i in range(4)])   # compacted into the snapshot
+    repository.add_bills([make_bill(i) for i in range(4, 6)])  # still in the log
+    repository.close()
+
+    with open(data_path) as f:
+        assert len(json.load(f)) == 4
+    with open(log_path) as f:
+        assert len(f.readlines()) == 2
+
+    reopened = open_store(store_paths)
+    assert reopened.bill_ids() == list(range(1, 7))
+
+
+
+def test_duplicates_are_skipped_and_reported(store_paths):
+    repository = open_store(store_paths)
+    bill_ids, inserted = repository.insert_bills([make_bill(1), make_bill(2), make_bill(1)])
+    assert bill_ids == [1, 2, 1]
+    assert inserted == [1, 2]
+
+    # Same account, date and kWh is the same bill, even if other fields differ
+    bill_ids, inserted = repository.insert_bills([dict(make_bill(2), total_bill_amount=1.0), make_bill(3)])
+    assert bill_ids == [2, 3]
+    assert inserted == [3]
+    assert repository.count() == 3
+
+
+
+def test_concurrent_processes_do_not_lose_bills_or_reuse_ids(store_paths):
+    workers = [multiprocessing.Process(target=write_bills, args=(store_paths, n * 100, 60)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+
+    repository = open_store(store_paths)
+    bills = repository.all_bills()
+    assert len(bills) == 240
+    assert sorted(bill['id'] for bill in bills) == list(range(1, 241))
+    assert sorted(bill['kwh_used'] for bill in bills) == sorted(
+        500 + n * 100 + i for n in range(4) for i in range(60))
+
+def test_writes_by_other_processes_are_picked_up(store_paths):
+    reader = open_store(store_paths)
+    writer = open_store(store_paths)
+    writer.add_bills([make_bill(i) for i in range(3)])
+    writer.flush()
+
+    version = reader.current_version()
+    assert reader.count() == 3
+
+    writer.add_bill(make_bill(3))
+    writer.flush()
+    assert reader.current_version() != version
+    assert reader.get_bill(4)['kwh_used'] == 503
+
+def test_torn_log_line_is_skipped_and_the_log_recovers(store_paths):
+    data_path, log_path = store_paths
+    repository = open_store(store_paths)
+    repository.add_bills([make_bill(i) for i in range(2)])
+    repository.close()
+
+    # A crash mid-append leaves a line without its newline
+    with open(log_path, 'a') as f:
+        f.write('{"account_number": "TORN", "bill_da')
+
+    reopened = open_store(store_paths)
+    assert reopened.count() == 2
+    assert reopened.add_bill(make_bill(2)) == 3
+    reopened.close()
+
+    with open(log_path) as f:
+        lines = f.read().splitlines()
+    assert lines[-1].startswith('{') and json.loads(lines[-1])['id'] == 3
+    assert open_store(store_paths).bill_ids() == [1, 2, 3]
+
+
+def test_last_append_is_fsynced_without_another_append(store_paths, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: (synced.append(fd), real_fsync(fd)))
+
+    repository = open_store(store_paths, fsync_every=100, fsync_interval=0.5)
+    repository.add_bill(make_bill(0))
+    repository.add_bill(make_bill(1))
+    synced.clear()
+
+    deadline = time.monotonic() + 5
+    while not synced and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert synced
+    repository.close()
+
+
+
+
+def test_cursor_paging_visits_every_bill_once(store_paths):
+    repository = open_store(store_paths)
+    repository.add_bills([make_bill(i) for i in range(53)])
+
+    def collect(**filters):
+        seen = []
+        cursor = 0
+        while True:
+            page = repository.page_bills(cursor, 10, **filters)
+            seen.extend(bill['id'] for bill in page)
+            if len(page) < 10:
+                return seen
+            cursor = page[-1]['id']
+
+    assert collect() == list(range(1, 54))
+    assert collect(account_number='ACCT2') == [i + 1 for i in range(53) if i % 5 == 2]
+
+    start, end = date(2012, 1, 1), date(2016, 12, 31)
+    in_range = [bill['id'] for bill in repository.all_bills()
+                if start <= date.fromisoformat(bill['bill_date']) <= end]
+    assert in_range
+    assert collect(start_date=start, end_date=end) == in_range
+    assert collect(start_date=date(2030, 1, 1)) == []
+
+
+def test_date_filter_sees_bills_added_after_the_first_query(store_paths):
+    repository = open_store(store_paths)
+    repository.add_bills([make_bill(i, bill_date='2020-01-15') for i in range(3)])
+    assert len(repository.page_bills(0, None, start_date=date(2020, 1, 1))) == 3
+
+    repository.add_bill(make_bill(3, bill_date='2020-02-15'))
+    page = repository.page_bills(0, None, start_date=date(2020, 2, 1), end_date=date(2020, 2, 28))
+    assert [bill['id'] for bill in page] == [4]
+
+def test_history_file_is_imported_once(store_paths, tmp_path):
+    history_path = str(tmp_path / 'historical_bills.json')
+    with open(history_path, 'w') as f:
+        json.dump([make_bill(i) for i in range(4)], f)
+
+    repository = open_store(store_paths)
+    assert import_history_file(repository, history_path) == 4
+    assert import_history_file(repository, history_path) == 0
+    assert os.path.exists(history_path)
+    assert os.path.exists(f"{history_path}.imported")
+    assert repository.training_count() == 4
+    assert {bill['source'] for bill in repository.all_bills()} == {'history'}
+
+
+def test_bill_frame_marks_training_bills_after_other_writes(store_paths, monkeypatch):
+    pytest.importorskip('pandas')
+    import config
+    from database.columnar import build_bill_frame
+
+    monkeypatch.setattr(config, 'TRAINING_SOURCES', ['history'])
+    repository = open_store(store_paths)
+    repository.add_bills([make_bill(i) for i in range(3)], source='history')
+    repository.add_bills([make_bill(i) for i in range(3, 5)], source='upload')
+    repository.flush()
+
+    # Written by another worker since this one last read the store
+    writer = open_store(store_paths)
+    writer.add_bill(make_bill(5), source='history')
+    writer.close()
+
+    df = build_bill_frame(repository)
+    assert list(df['id']) == [1, 2, 3, 4, 5, 6]
+    assert list(df['in_training']) == [True, True, True, False, False, True]
+
+def test_sql_repository_matches_json_store_ids(store_paths, tmp_path):
+    pytest.importorskip('sqlalchemy')
+    seed = open_store(store_paths)
+    seed.add_bills([make_bill(i) for i in range(5)])
+    seed.add_bill(dict(make_bill(5), account_number=None))
+    seed.close()
+
+    data_path, log_path = store_paths
+    repository = SQLBillRepository(f"sqlite:///{tmp_path / 'bills.db'}", data_path, log_path)
+    assert repository.bill_ids() == [1, 2, 3, 4, 5, 6]
+
+    bill_ids, inserted = repository.insert_bills([make_bill(4), make_bill(6)])
+    assert bill_ids == [5, 7]
+    assert inserted == [7]
+    repository.close()
+
+
+def wait_for(job, timeout=5):
+    """Wait for a background job to finish"""
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.finished
+
+
+def test_jobs_are_visible_to_other_workers_through_the_job_store(tmp_path):
+    from services.job_manager import JobError, JobManager
+
+    def pipeline(job, fail):
+        job.set_stage('extracting')
+        job.add_event('extracted', {'kwh_used': 500})
+        if fail:
+            raise JobError("Failed to extract data from bill")
+        return {'bill_data': {'kwh_used': 500}}
+
+    directory = str(tmp_path / 'jobs')
+    runner = JobManager(max_workers=1, max_jobs=1, directory=directory)
+    other_worker = JobManager(max_workers=1, directory=directory)
+    succeeded = runner.submit('upload', pipeline, False)
+    failed = runner.submit('upload', pipeline, True)
+    wait_for(failed)
+
+    stored = other_worker.get(succeeded.id)
+    assert stored.to_dict() == succeeded.to_dict()
+    assert stored.to_dict()['result'] == {'bill_data': {'kwh_used': 500}}
+    assert [event['event'] for event in stored.events_since(0)] == ['stage', 'extracted', 'succeeded']
+    assert stored.events_since(2) == succeeded.events_since(2)
+
+    stored = other_worker.get(failed.id)
+    assert stored.status == 'failed'
+    assert stored.events_since(2)[0]['data'] == {'error': "Failed to extract data from bill"}
+
+    # Pruning forgets the oldest finished job in every worker
+    wait_for(runner.submit('upload', pipeline, False))
+    runner.shutdown()
+    assert other_worker.get(succeeded.id) is None
+    assert other_worker.get('../jobs') is None
+
+
+def make_upload(content, filename='bill.PDF'):
+    from starlette.datastructures import UploadFile
+    return UploadFile(io.BytesIO(content), filename=filename)
+
+
+def test_uploads_are_stored_by_content_hash(tmp_path):
+    from utils.upload_utils import save_upload
+
+    content = b'%PDF-1.4 ' + os.urandom(3 * 1024 * 1024)
+    upload_dir = str(tmp_path / 'raw')
+    path, digest = asyncio.run(save_upload(make_upload(content), upload_dir, max_bytes=len(content)))
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert path == os.path.join(upload_dir, f"{digest}.pdf")
+    with open(path, 'rb') as f:
+        assert f.read() == content
+
+    assert asyncio.run(save_upload(make_upload(content), upload_dir, max_bytes=len(content)))[0] == path
+    assert os.listdir(upload_dir) == [os.path.basename(path)]
+
+
+def test_oversized_uploads_are_rejected_with_413(tmp_path, monkeypatch):
+    import config
+    from fastapi import HTTPException
+    from utils.upload_utils import UploadTooLargeError, save_upload
+
+    upload_dir = str(tmp_path / 'raw')
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_upload(make_upload(b'x' * 2049), upload_dir, max_bytes=2048))
+    # The partial file is removed
+    assert os.listdir(upload_dir) == []
+
+    main = pytest.importorskip('api.main')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'MAX_UPLOAD_BYTES', 2048)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.upload_bill(make_upload(b'x' * 4096), 3, services=None))
+    assert error.value.status_code == 413
+    assert os.listdir(tmp_path / 'data' / 'raw') == []
+
+
+def test_job_events_stream_partial_results_and_resume(tmp_path):
+    from types import SimpleNamespace
+    from services.job_manager import JobManager
+    main = pytest.importorskip('api.main')
+
+    def pipeline(job):
+        job.set_stage('extracting')
+        job.add_event('extracted', {'bill_data': {'kwh_used': 500}})
+        job.set_stage('predicting')
+        return {'predictions': [1, 2]}
+
+    async def connected():
+        return False
+
+    def stream(job_manager, job_id, last_event_id=None):
+        response = asyncio.run(main.get_job_events(job_id, SimpleNamespace(is_disconnected=connected),
+                                                   last_event_id, SimpleNamespace(job_manager=job_manager)))
+        assert response.media_type == 'text/event-stream'
+
+        async def read():
+            return ''.join([chunk async for chunk in response.body_iterator])
+        return asyncio.run(read())
+
+    directory = str(tmp_path / 'jobs')
+    runner = JobManager(max_workers=1, directory=directory)
+    job = runner.submit('upload', pipeline)
+
+    body = stream(runner, job.id)
+    events = [block.split('\n') for block in body.strip().split('\n\n')]
+    assert [lines[1] for lines in events] == [
+        'event: stage', 'event: extracted', 'event: stage', 'event: succeeded']
+    assert events[1] == ['id: 1', 'event: extracted', 'data: {"bill_data": {"kwh_used": 500}}']
+    assert events[-1][2] == 'data: {"predictions": [1, 2]}'
+
+    # A reconnecting client resumes after the last event it saw, from any worker
+    other_worker = JobManager(max_workers=1, directory=directory)
+    assert stream(other_worker, job.id, last_event_id='1') == '\n\n'.join(body.split('\n\n')[2:])
+    runner.shutdown()
+
+    from fastapi import HTTPException
+    with pytest.raises(HTTPException) as error:
+        stream(other_worker, 'f' * 32)
+    assert error.value.status_code == 404
+
+
+def test_metrics_record_route_templates_and_stages():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from utils.metrics import MetricsMiddleware, time_stage
+    main = pytest.importorskip('api.main')
+
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get('/metrics-test/{bill_id}')
+    def read(bill_id: int):
+        with time_stage('metrics_test_stage'):
+            return {'id': bill_id}
+
+    client = TestClient(app)
+    for bill_id in (1, 2, 3):
+        assert client.get(f'/metrics-test/{bill_id}').status_code == 200
+    assert client.get('/metrics-test/x').status_code == 422
+
+    response = asyncio.run(main.metrics())
+    assert response.media_type.startswith('text/plain; version=0.0.4')
+    lines = response.body.decode().splitlines()
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert 'http_requests_total{method="GET",route="/metrics-test/{bill_id}",status="200"} 3' in lines
+    assert 'http_requests_total{method="GET",route="/metrics-test/{bill_id}",status="422"} 1' in lines
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/metrics-test/{bill_id}",le="+Inf"} 4' in lines
+    assert 'http_request_duration_seconds_count{method="GET",route="/metrics-test/{bill_id}"} 4' in lines
+    assert 'stage_duration_seconds_count{stage="metrics_test_stage"} 3' in lines
+    assert not any('/metrics-test/1' in line for line in lines)
+
+
+def test_bulk_validation_reports_positions():
+    bills_router = pytest.importorskip('api.routers.bills')
+    valid = {
+        'account_number': 'A1', 'bill_date': '2024-01-05', 'billing_start_date': '2023-12-01',
+        'billing_end_date': '2024-01-01', 'days_in_billing_period': 31, 'kwh_used': 500,
+        'meter_start_value': 0, 'meter_end_value': 500, 'avg_daily_usage': 16,
+        'total_bill_amount': 90, 'utility_price_to_compare': 0.1, 'supplier_rate': 0.1,
+        'customer_charge': 4, 'distribution_related_component': 10, 'cost_recovery_charges': 1,
+        'consumer_rate_credit': 0, 'utility_charges': 40, 'supplier_charges': 50
+    }
+
+    bills, errors = bills_router.validate_bills([valid, dict(valid, kwh_used=600)])
+    assert errors == []
+    assert len(bills) == 2 and bills[0]['bill_date'] == '2024-01-05'
+
+    # NDJSON lines are parsed; in a JSON array a string is not a bill
+    bills, errors = bills_router.validate_bills([json.dumps(valid).encode(), b'{oops', b'[1]'], lines=True)
+    assert bills == []
+    assert [error['index'] for error in errors] == [1, 2]
+    bills, errors = bills_router.validate_bills([valid, json.dumps(valid), 7])
+    assert bills == []
+    assert errors == [{'index': 1, 'error': "Expected a JSON object"}, {'index': 2, 'error': "Expected a JSON object"}]
+
+    bills, errors = bills_router.validate_bills(
+        [valid, '{oops', dict(valid, kwh_used='abc')], first_index=100)
+    assert bills == []
+    assert [error['index'] for error in errors] == [101, 102]
+
+
+def test_repeat_extractions_are_served_from_the_cache(tmp_path, monkeypatch):
+    fitz = pytest.importorskip('fitz')
+    extraction = pytest.importorskip('scripts.direct_gemini_extraction')
+
+    calls = []
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, parts):
+            calls.append(parts[0])
+            return type('Response', (), {'text': '```json\n{"account_number": "A1", "kwh_used": 512}\n```'})
+
+    monkeypatch.setattr(extraction.genai, 'configure', lambda **kwargs: None)
+    monkeypatch.setattr(extraction.genai, 'GenerativeModel', FakeModel)
+    monkeypatch.chdir(tmp_path)
+
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Electric bill")
+    doc.save('bill.pdf')
+    doc.close()
+    with open('bill.pdf', 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+
+    expected = {'account_number': 'A1', 'kwh_used': 512}
+    assert extraction.extract_bill_data('bill.pdf', 'key') == expected
+    assert len(calls) == 1
+
+    # Same content under another name, with the digest save_upload computed
+    os.rename('bill.pdf', f'{digest}.pdf')
+    assert extraction.extract_bill_data(f'{digest}.pdf', 'key', pdf_sha256=digest) == expected
+    assert len(calls) == 1
+    assert not [name for name in os.listdir('.') if name.startswith('temp_bill_')]
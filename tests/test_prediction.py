@@ -0,0 +1,290 @@
+import json
+import os
+import shutil
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from database.repository import BillRepository
+from ml_models.usage_predictor import UsagePredictor
+from services.history_provider import HistoryProvider
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+
+
+def make_bills(account_number, months, start_kwh=500):
+    """Monthly bills for one account"""
+    return [{'account_number': account_number, 'bill_date': f"2023-{month + 1:02d}-15",
+             'kwh_used': start_kwh + month, 'total_bill_amount': 90.0}
+            for month in range(months)]
+
+
+def make_history(months, start='2022-01-15', seed=0, missing_temps=False):
+    """A monthly bill history with seasonal usage"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=months, freq='30D')
+    temps = 55 + 20 * np.sin(2 * np.pi * (dates.month.to_numpy() - 4) / 12)
+    df = pd.DataFrame({
+        'bill_date': dates,
+        'kwh_used': np.round(600 + 300 * rng.random(months)),
+        'avg_daily_temperature': temps,
+        'days_in_billing_period': 30,
+    })
+    if missing_temps:
+        df.loc[::2, 'avg_daily_temperature'] = np.nan
+    # Histories aren't necessarily stored in date order
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def usage_predictor():
+    predictor = UsagePredictor(MODELS_DIR)
+    if not predictor._load_model():
+        pytest.skip("usage model files not available")
+    return predictor
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = BillRepository(str(tmp_path / 'bills.json'), str(tmp_path / 'bills.log.jsonl'))
+    yield repository
+    repository.close()
+
+
+def count_series_loads(repository, monkeypatch):
+    """Record the accounts whose series the repository builds"""
+    loads = []
+    account_series = repository.account_series
+    monkeypatch.setattr(repository, 'account_series',
+                        lambda account_number: (loads.append(account_number), account_series(account_number))[1])
+    return loads
+
+
+def test_history_cache_evicts_least_recently_used_accounts(repository, monkeypatch):
+    for account in ['A', 'B', 'C']:
+        repository.add_bills(make_bills(account, 12))
+    loads = count_series_loads(repository, monkeypatch)
+
+    one_frame = HistoryProvider(repository).get('A')
+    frame_bytes = int(one_frame.memory_usage(index=True, deep=True).sum())
+    loads.clear()
+
+    provider = HistoryProvider(repository, max_bytes=2 * frame_bytes)
+    provider.get('A')
+    provider.get('B')
+    provider.get('A')      # A is now the most recently used
+    provider.get('C')      # over budget: B is evicted
+    assert provider.cached_bytes <= provider.max_bytes
+    assert list(provider._frames) == ['A', 'C']
+
+    loads.clear()
+    provider.get('A')
+    provider.get('B')
+    assert loads == ['B']
+
+    # A frame larger than the whole budget is returned but not cached
+    tiny = HistoryProvider(repository, max_bytes=frame_bytes // 2)
+    assert len(tiny.get('A')) == 12
+    assert tiny.cached_bytes == 0
+
+
+def test_history_frames_are_only_rebuilt_when_their_account_changes(repository, monkeypatch):
+    repository.add_bills(make_bills('A', 6))
+    repository.add_bills(make_bills('B', 6))
+    loads = count_series_loads(repository, monkeypatch)
+    provider = HistoryProvider(repository)
+
+    provider.get('A')
+    provider.get('B')
+    repository.add_bill(make_bills('B', 1, start_kwh=900)[0])
+    loads.clear()
+
+    assert len(provider.get('A')) == 6
+    assert len(provider.get('B')) == 7
+    assert loads == ['B']
+    assert provider.get('missing') is None
+
+
+def test_predict_many_matches_predict(usage_predictor):
+    histories = {
+        'one_bill': make_history(1, seed=1),
+        'two_bills': make_history(2, seed=2),
+        'year': make_history(12, seed=3),
+        'long': make_history(40, start='2019-03-01', seed=4),
+        'gaps': make_history(9, seed=5, missing_temps=True),
+    }
+
+    batched = usage_predictor.predict_many(histories, future_months=4)
+
+    assert list(batched) == list(histories)
+    for account, history in histories.items():
+        expected = usage_predictor.predict(history, future_months=4)
+        pd.testing.assert_frame_equal(batched[account], expected, check_dtype=False)
+
+
+def test_predict_many_skips_empty_histories(usage_predictor):
+    batched = usage_predictor.predict_many({'empty': pd.DataFrame(), 'none': None,
+                                            'year': make_history(12)})
+    assert list(batched) == ['year']
+    assert usage_predictor.predict_many({}) == {}
+
+
+def test_appliance_batch_matches_single_predictions(monkeypatch):
+    main = pytest.importorskip('api.main')
+    from services.container import load_ml_models
+
+    services = SimpleNamespace(ml_models=load_ml_models(MODELS_DIR))
+    if 'appliance_model' not in services.ml_models:
+        pytest.skip("appliance model files not available")
+    # No Gemini recommendations for the single endpoint
+    monkeypatch.setattr(main, 'api_key', None)
+
+    rng = np.random.default_rng(7)
+    hours = [0, 0, 0.5, 1, 2, 4, 8, 24]
+    scenarios = [main.ApplianceUsageRequest(
+        air_conditioner=rng.choice(hours), refrigerator=rng.choice(hours), water_heater=rng.choice(hours),
+        clothes_dryer=rng.choice(hours), washing_machine=rng.choice(hours),
+        household_size=int(rng.integers(1, 7)), home_sqft=int(rng.integers(600, 4000))
+    ) for _ in range(50)]
+    scenarios.append(main.ApplianceUsageRequest(refrigerator=0))  # nothing running
+
+    batch = main.predict_from_appliances_batch(main.ApplianceBatchRequest(scenarios=scenarios), services)
+
+    assert len(batch['predictions']) == len(scenarios)
+    for scenario, prediction in zip(scenarios, batch['predictions']):
+        assert prediction == main.predict_appliance_usage(scenario, services)['prediction']
+
+
+def test_result_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    from services import result_cache
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+
+    cache = result_cache.ResultCache(max_entries=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1   # a is now the most recently used
+    cache.put('c', 3)            # over max_entries: b is evicted
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    now[0] += 61
+    assert cache.get('a') is None
+
+
+def make_services(models_dir):
+    """A service container on a copy of the models, without the bill store"""
+    from ml_models.anomaly_detector import AnomalyDetector
+    from ml_models.cost_predictor import CostPredictor
+    from services.container import ServiceContainer
+    from services.result_cache import model_files_version
+
+    shutil.copytree(MODELS_DIR, models_dir)
+    services = ServiceContainer(models_dir)
+    services._prediction_service = SimpleNamespace(usage_predictor=UsagePredictor(models_dir),
+                                                   cost_predictor=CostPredictor(models_dir),
+                                                   anomaly_detector=AnomalyDetector(models_dir))
+    services.model_version = model_files_version(models_dir)
+    if 'combined_model' not in services.ml_models or 'appliance_model' not in services.ml_models:
+        pytest.skip("model files not available")
+    return services
+
+
+def test_model_changes_retire_cached_results_and_bad_files_keep_old_models(tmp_path):
+    from services.result_cache import ResultCache
+
+    models_dir = str(tmp_path / 'models')
+    services = make_services(models_dir)
+    models = services.ml_models
+    usage_predictor = services.prediction_service.usage_predictor
+    assert usage_predictor._load_model()
+    usage_model = usage_predictor.model
+
+    version = services.current_model_version()
+    key = ResultCache.make_key('appliances', {'refrigerator': 24}, version)
+    services.result_cache.put(key, {'prediction': 1})
+
+    # A model file caught half-written, as by a non-atomic save
+    for name in ['combined_predictor_model.pkl', 'usage_predictor_model.pkl']:
+        path = os.path.join(models_dir, name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+    new_version = services.current_model_version()
+    assert new_version != version
+    assert ResultCache.make_key('appliances', {'refrigerator': 24}, new_version) != key
+    assert services.result_cache.get(key) is None
+    # The models already loaded go on serving
+    assert services.ml_models is models
+    assert usage_predictor.model is usage_model
+
+
+def test_appliance_get_revalidates_with_the_etag(tmp_path, monkeypatch):
+    import asyncio
+    main = pytest.importorskip('api.main')
+    monkeypatch.setattr(main, 'api_key', None)
+    services = make_services(str(tmp_path / 'models'))
+    scenario = main.ApplianceUsageRequest(air_conditioner=4, household_size=2)
+
+    def get(if_none_match=None):
+        return asyncio.run(main.get_appliance_prediction(scenario, if_none_match, services))
+
+    response = get()
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert json.loads(response.body)['prediction'] == main.predict_appliance_usage(scenario, services)['prediction']
+
+    assert get(etag).status_code == 304
+    assert get(f'W/{etag}, "other"').status_code == 304
+    assert get('"other"').status_code == 200
+
+    # New model files give a new ETag
+    path = os.path.join(services.models_dir, 'appliance_predictor_scaler.pkl')
+    os.utime(path, ns=(0, 0))
+    response = get(etag)
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_concurrent_model_loads_set_model_and_scaler_together():
+    predictor = UsagePredictor(MODELS_DIR)
+    if not os.path.exists(os.path.join(MODELS_DIR, 'usage_predictor_model.pkl')):
+        pytest.skip("usage model files not available")
+
+    partial = []
+
+    def watch():
+        # Predictions check the model, then use the scaler
+        while predictor.model is None:
+            pass
+        if predictor.scaler is None:
+            partial.append(True)
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    loaders = [threading.Thread(target=predictor._load_model) for _ in range(4)]
+    watcher.start()
+    for loader in loaders:
+        loader.start()
+    for loader in loaders + [watcher]:
+        loader.join(timeout=60)
+
+    assert not partial
+    assert predictor.model is not None and predictor.scaler is not None
+
+
+def test_importing_the_api_does_not_load_pandas():
+    import subprocess
+    import sys
+
+    code = ("import sys; import api.main; "
+            "print(sorted(m for m in ('numpy', 'pandas', 'pyarrow', 'sklearn') if m in sys.modules))")
+    root = os.path.dirname(MODELS_DIR)
+    result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=root, GEMINI_API_KEY=''), timeout=120)
+    if result.returncode != 0:
+        pytest.skip(f"api.main can't be imported here: {result.stderr.strip().splitlines()[-1:]}")
+    assert result.stdout.strip().splitlines()[-1] == '[]'
@@ -1,87 +1,80 @@
 # utils/data_manager.py
 import os
-import json
-import pandas as pd
+import sys
 from datetime import datetime
 
-def save_bill_data_to_history(bill_data):
-    """Save bill data to a historical dataset for improving predictions"""
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.repository import get_bill_repository
+from database.columnar import load_bill_frame
+
+def save_bill_data_to_history(bill_data, source='upload'):
+    """Save bill data to the bill store for serving and improving predictions"""
     try:
-        # Path for historical data
-        history_path = 'data/processed/historical_bills.json'
-        
-        # Load existing historical data or create a new dataset
-        try:
-            with open(history_path, 'r') as f:
-                historical_bills = json.load(f)
-                print(f"Loaded {len(historical_bills)} historical bills")
-        except (FileNotFoundError, json.JSONDecodeError):
-            historical_bills = []
-            print("Creating new historical bills dataset")
-        
-        # Check if we already have this bill in our history (avoid duplicates)
-        is_duplicate = False
-        for existing_bill in historical_bills:
-            # Compare key fields to determine if this is a duplicate
-            if (existing_bill.get('account_number') == bill_data.get('account_number') and
-                existing_bill.get('bill_date') == bill_data.get('bill_date') and
-                existing_bill.get('kwh_used') == bill_data.get('kwh_used')):
-                is_duplicate = True
-                break
-        
-        # Only add if it's not a duplicate
-        if not is_duplicate:
-            historical_bills.append(bill_data)
-            
-            # Save updated history
-            with open(history_path, 'w') as f:
-                json.dump(historical_bills, f, indent=2, default=str)
-            print(f"Added new bill to historical dataset (total: {len(historical_bills)})")
-            
-            # Periodically retrain models if we have enough new data
-            if len(historical_bills) % 5 == 0:  # Retrain after every 5 new bills
-                print("Dataset has grown - scheduling model retraining")
-                # This could be a background task for a real app
-                # For hackathon, we can use a simple flag file:
-                os.makedirs('data/models', exist_ok=True)
-                with open('data/models/retrain_needed.txt', 'w') as f:
-                    f.write(str(datetime.now()))
-        else:
-            print("Bill already exists in historical dataset - skipping")
-                
+        added = save_bills_to_history([bill_data], source=source)
+        if not added:
+            print("Bill already exists in the bill store - skipping")
         return True
     except Exception as e:
         print(f"Error saving bill to history: {str(e)}")
         return False
 
+def save_bills_to_history(bills, source='upload'):
+    """
+    Save a batch of bills to the bill store
+    
+    Duplicates (against the stored bills and within the batch) are
+    dropped by the store's dedup index, and the new bills are written
+    in a single append.
+    
+    Args:
+        bills: List of bill dictionaries
+        source: Source recorded on the new bills
+        
+    Returns:
+        Number of bills added
+    """
+    repository = get_bill_repository()
+    previous_training_count = repository.training_count()
+    
+    # The store decides what is new under its own lock, so bills written
+    # by other workers meanwhile aren't counted as ours
+    _, inserted_ids = repository.insert_bills(bills, source=source)
+    
+    added = len(inserted_ids)
+    if not added:
+        return 0
+    
+    training_count = repository.training_count()
+    print(f"Added {added} new bill(s) to the bill store (training bills: {training_count})")
+    
+    # Periodically retrain models if we have enough new data
+    if previous_training_count // 5 != training_count // 5:  # Retrain after every 5 new bills
+        print("Dataset has grown - scheduling model retraining")
+        # This could be a background task for a real app
+        # For hackathon, we can use a simple flag file:
+        os.makedirs('data/models', exist_ok=True)
+        with open('data/models/retrain_needed.txt', 'w') as f:
+            f.write(str(datetime.now()))
+    
+    return added
+
 def retrain_models_with_history():
     """Retrain prediction models using the accumulated historical data"""
     try:
-        # Path for historical data
-        history_path = 'data/processed/historical_bills.json'
+        # Training view of the bill store, from the typed columnar snapshot
+        df = load_bill_frame(view='training')
         
         # Check if we have enough data and if retraining is needed
-        try:
-            with open(history_path, 'r') as f:
-                historical_bills = json.load(f)
-            
-            if len(historical_bills) < 10:  # Need at least 10 bills for meaningful training
-                print("Not enough historical data for retraining")
-                return False
-        except (FileNotFoundError, json.JSONDecodeError):
+        if df.empty:
             print("No historical data found")
             return False
+        if len(df) < 10:  # Need at least 10 bills for meaningful training
+            print("Not enough historical data for retraining")
+            return False
         
-        print(f"Retraining models with {len(historical_bills)} bills")
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(historical_bills)
-        
-        # Fix date fields
-        date_columns = ['bill_date', 'billing_start_date', 'billing_end_date', 'due_date']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+        print(f"Retraining models with {len(df)} bills")
         
         # Skip records with missing essential data
         df = df.dropna(subset=['kwh_used', 'total_bill_amount'])
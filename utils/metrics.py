@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Histogram bucket upper bounds (seconds), from fast cached reads to slow Gemini calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(label_names, label_values, extra=()):
+    """Format label pairs as {name="value",...} (empty string if there are none)"""
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    """Format a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    metric_type = None
+
+    def __init__(self, name, help_text, label_names=()):
+        """
+        Initialize a metric
+
+        Args:
+            name: Metric name (e.g. "http_requests_total")
+            help_text: Description shown in the exposition output
+            label_names: Names of the labels every sample has
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """Label values in label_names order"""
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        """Lines of Prometheus text exposition format for this metric"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """Add to the count for the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        """Raise the gauge for the given labels"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """Lower the gauge for the given labels"""
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initialize a histogram
+
+        Args:
+            name: Metric name (e.g. "http_request_duration_seconds")
+            help_text: Description shown in the exposition output
+            label_names: Names of the labels every sample has
+            buckets: Sorted bucket upper bounds; +Inf is added automatically
+        """
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """Record one observation for the given labels"""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        """Lines of Prometheus text exposition format, with cumulative buckets"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Initialize the metrics registry
+
+        Holds the process's request and stage metrics and renders them in
+        the Prometheus text format for GET /metrics. Metrics are kept per
+        worker process, so each worker is scraped (or aggregated) separately.
+        """
+        self.requests = Counter(
+            'http_requests_total', 'HTTP requests handled, by route and status',
+            ('method', 'route', 'status'))
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time to handle an HTTP request, including streaming the body',
+            ('method', 'route'))
+        self.in_progress = Gauge(
+            'http_requests_in_progress', 'HTTP requests currently being handled',
+            ('method',))
+        self.stage_duration = Histogram(
+            'stage_duration_seconds', 'Time spent in a processing stage (extraction, inference, Gemini calls...)',
+            ('stage',))
+        self.stage_errors = Counter(
+            'stage_errors_total', 'Processing stages that raised an exception',
+            ('stage',))
+        self._metrics = [self.requests, self.request_duration, self.in_progress,
+                         self.stage_duration, self.stage_errors]
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """Get the process-wide metrics registry, creating it on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
+
+
+@contextmanager
+def time_stage(stage):
+    """
+    Time a processing stage into stage_duration_seconds
+
+    Works as a context manager (with time_stage('extraction'): ...) or as a
+    function decorator (@time_stage('usage_inference')). Exceptions are
+    counted in stage_errors_total and re-raised.
+
+    Args:
+        stage: Name of the stage
+    """
+    metrics = get_metrics()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        metrics.stage_errors.inc(stage=stage)
+        raise
+    finally:
+        metrics.stage_duration.observe(time.perf_counter() - started, stage=stage)
+
+
+def _route_template(scope):
+    """
+    Path template of the route that handled a request (e.g.
+    /api/bills/{bill_id}), or "unmatched" if no route matched
+
+    Rebuilt from the request path and its path parameters, since the matched
+    route's own path doesn't include the prefixes of included routers.
+    """
+    if scope.get('route') is None:
+        return 'unmatched'
+    names = {str(value): f"{{{name}}}" for name, value in scope.get('path_params', {}).items()}
+    if not names:
+        return scope['path']
+    return '/'.join(names.get(segment, segment) for segment in scope['path'].split('/'))
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        """
+        ASGI middleware recording per-route request counts, latency
+        histograms and in-flight requests
+
+        Requests are labelled with the route template (e.g.
+        /api/bills/{bill_id}) rather than the raw path, so the number of
+        series stays bounded; requests that match no route are labelled
+        "unmatched".
+
+        Args:
+            app: ASGI application to wrap
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        metrics = get_metrics()
+        method = scope['method']
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        metrics.in_progress.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_progress.dec(method=method)
+            route = _route_template(scope)
+            metrics.request_duration.observe(time.perf_counter() - started, method=method, route=route)
+            metrics.requests.inc(method=method, route=route, status=status)
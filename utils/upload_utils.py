@@ -0,0 +1,70 @@
+import os
+import sys
+import uuid
+import asyncio
+import hashlib
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from utils.metrics import time_stage
+
+# Directory uploaded bills are stored in
+UPLOAD_DIR = 'data/raw'
+
+# Bytes read from the upload per chunk
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the size cap"""
+    pass
+
+
+async def save_upload(upload_file, upload_dir=UPLOAD_DIR, max_bytes=None):
+    """
+    Stream an uploaded file to disk in chunks, hashing it on the way
+
+    Files are stored by content hash, so the same bill uploaded twice maps
+    to the same path, and concurrent uploads never overwrite each other.
+
+    Args:
+        upload_file: FastAPI UploadFile
+        upload_dir: Directory to store the file in
+        max_bytes: Size cap, defaults to config.MAX_UPLOAD_BYTES
+
+    Returns:
+        Tuple of (stored file path, SHA-256 hex digest of the content)
+
+    Raises:
+        UploadTooLargeError: If the upload is larger than max_bytes
+    """
+    max_bytes = config.MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    os.makedirs(upload_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(upload_dir, f".{uuid.uuid4().hex}.part")
+    try:
+        with time_stage('upload_save'), open(tmp_path, 'wb') as f:
+            while True:
+                chunk = await upload_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Upload is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+
+        extension = os.path.splitext(upload_file.filename or '')[1].lower() or '.pdf'
+        file_path = os.path.join(upload_dir, f"{digest.hexdigest()}{extension}")
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return file_path, digest.hexdigest()
+